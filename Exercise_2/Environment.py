@@ -9,12 +9,19 @@ import numpy as np
 import numpy.random as rn
 
 
-class Environment:
+class Environment(object):
   """
   Environment for the robot to run around. Holds a list of objects
   the robot should either avoid or catch.
+
+  The objects are stored as arrays of their x, y and r, sorted into a
+  uniform grid on the torus with cells at least as large as the sensor
+  range, so the sensors only have to look at the objects in the 3x3 cells
+  around the robot.
   """
 
+  Range = 25.0  # Sensor range
+
   def __init__(self, _Obs, _MinSize, _MaxSize, _xmax, _ymax):
     """
     Create a new environment comprising a list of length Obs of objects.
@@ -32,11 +39,103 @@ class Environment:
     self.xmax = _xmax
     self.ymax = _ymax
 
-    self.Obs = [{'x': rn.rand()*_xmax,
-                 'y': rn.rand()*_ymax,
-                 'r': _MinSize + rn.rand()*(_MaxSize - _MinSize)
-                 } for _ in xrange(_Obs)
-                ]
+    # One row of random numbers per object, drawn in the same order as
+    # x, y and r of one object after another.
+    r = rn.rand(_Obs, 3)
+    self.SetObjects(r[:, 0]*_xmax, r[:, 1]*_ymax,
+                    _MinSize + r[:, 2]*(_MaxSize - _MinSize))
+
+  def SetObjects(self, x, y, r):
+    """
+    Replace the objects with the ones with positions (x, y) and sizes r.
+    """
+
+    self.x = np.asarray(x, dtype=float)
+    self.y = np.asarray(y, dtype=float)
+    self.r = np.asarray(r, dtype=float)
+
+    # Cells are a bit larger than the sensor range, so objects further than
+    # one cell away are always out of range.
+    self.nx = max(1, int(np.ceil(self.xmax / self.Range)) - 1)
+    self.ny = max(1, int(np.ceil(self.ymax / self.Range)) - 1)
+
+    cell = self.Cell(self.x, self.y)
+    self.order = np.argsort(cell, kind='mergesort')
+    self.start = np.searchsorted(cell[self.order], np.arange(self.nx*self.ny + 1))
+
+  @property
+  def Obs(self):
+    """
+    Objects as a list of dictionaries with keys 'x', 'y' and 'r'. Assigning
+    a list of such dictionaries replaces the objects.
+    """
+    return [{'x': x, 'y': y, 'r': r} for (x, y, r) in zip(self.x, self.y, self.r)]
+
+  @Obs.setter
+  def Obs(self, Obs):
+    self.SetObjects([Ob['x'] for Ob in Obs], [Ob['y'] for Ob in Obs],
+                    [Ob['r'] for Ob in Obs])
+
+  def Cell(self, x, y):
+    """
+    Return the number of the grid cell of each position (x, y).
+    """
+
+    cx = np.floor(np.asarray(x) * self.nx / self.xmax).astype(int) % self.nx
+    cy = np.floor(np.asarray(y) * self.ny / self.ymax).astype(int) % self.ny
+    return cy*self.nx + cx
+
+  def Nearby(self, x, y):
+    """
+    Return the objects in the 3x3 grid cells around each position (x, y),
+    which include all objects within sensor range, as (robot, object) pairs.
+
+    Inputs:
+    x, y -- Arrays with the positions of the robots
+
+    Outputs:
+    robot, near -- Arrays with the index of the position and of the object
+                   of each pair
+    """
+
+    R = len(x)
+
+    # With at most 3x3 cells every object is nearby
+    if self.nx <= 3 and self.ny <= 3:
+      pairs = np.arange(R * len(self.x))
+      return (pairs // len(self.x), pairs % len(self.x))
+
+    # The distinct cells around each position, one row per position. A grid
+    # less than 3 cells wide has all its columns (or rows) nearby.
+    di = [-1, 0, 1] if self.nx >= 3 else range(self.nx)
+    dj = [-1, 0, 1] if self.ny >= 3 else range(self.ny)
+
+    cell = self.Cell(x, y)
+    (cx, cy) = (cell % self.nx, cell // self.nx)
+
+    cells = np.array([((cy + j) % self.ny)*self.nx + (cx + i) % self.nx
+                      for i in di for j in dj]).T.ravel()
+
+    # Concatenate the runs of objects of all those cells
+    first = self.start[cells]
+    count = self.start[cells + 1] - first
+    offset = np.cumsum(count) - count
+
+    robot = np.repeat(np.arange(R), count.reshape(R, -1).sum(1))
+    near = self.order[np.repeat(first - offset, count) + np.arange(count.sum())]
+
+    return (robot, near)
+
+  @staticmethod
+  def TorusDistance(x2, x, xmax):
+    """
+    Return x2 - x, x2 + xmax - x or x2 - xmax - x, whichever is shortest.
+    """
+
+    d = x2 - x
+    (up, down) = ((x2 + xmax) - x, (x2 - xmax) - x)
+
+    return np.where(abs(up) < abs(d), up, np.where(abs(down) < abs(d), down, d))
 
   def GetSensors(self, x, y, w):
     """
@@ -45,55 +144,53 @@ class Environment:
     All geometry is calculated on a torus with limits xmax and ymax.
 
     Inputs:
-    x, y, w -- Position and orientation of robot
+    x, y, w -- Position and orientation of robot, or arrays with the
+               positions and orientations of several robots
 
     Outputs:
-    SL, SR -- Activities of left and right sensor
+    SL, SR -- Activities of left and right sensor, or arrays with the
+              activities of each robot
     """
 
-    SL = 0
-    SR = 0
-    Range = 25.0  # Sensor range
+    Range = self.Range
+
+    # Flat arrays with one entry per robot
+    zero = np.zeros(np.broadcast(x, y, w).shape)
+    shape = zero.shape
+    (x, y, w) = ((x + zero).ravel(), (y + zero).ravel(), (w + zero).ravel())
 
-    for Ob in self.Obs:
-      x2 = Ob['x']
-      y2 = Ob['y']
+    # One (robot, object) pair for each object near each robot
+    (robot, near) = self.Nearby(x, y)
+    (x, y, w) = (x[robot], y[robot], w[robot])
 
-      # Find the shortest x distance on torus
-      if abs(x2 + self.xmax - x) < abs(x2 - x):
-        x2 = x2 + self.xmax
-      elif abs(x2 - self.xmax - x) < abs(x2 - x):
-        x2 = x2 - self.xmax
+    # Find the shortest x and y distances on torus
+    dx = self.TorusDistance(self.x[near], x, self.xmax)
+    dy = self.TorusDistance(self.y[near], y, self.ymax)
 
-      # Find shortest y distance on torus
-      if abs(y2 + self.ymax - y) < abs(y2 - y):
-        y2 = y2 + self.ymax
-      elif abs(y2 - self.ymax - y) < abs(y2 - y):
-        y2 = y2 - self.ymax
+    # np.power squares like the scalar dx**2, which is not always dx*dx
+    z = np.sqrt(np.power(dx, 2) + np.power(dy, 2))
 
-      dx = x2 - x
-      dy = y2 - y
+    seen = z < Range
+    (robot, dx, dy, z, w) = (robot[seen], dx[seen], dy[seen], z[seen], w[seen])
 
-      z = np.sqrt(dx**2 + dy**2)
+    v = np.arctan2(dy, dx)
+    v = np.where(v < 0, 2*np.pi + v, v)
 
-      if z < Range:
-        v = np.arctan2(dy, dx)
-        if v < 0:
-          v = 2*np.pi + v
+    dw = v - w  # angle difference between robot's heading and object
 
-        dw = v - w  # angle difference between robot's heading and object
+    # Stimulus strength depends on distnace to object boundary
+    S = (Range - z)/Range
 
-        # Stimulus strength depends on distnace to object boundary
-        S = (Range - z)/Range
+    left = (((dw >= np.pi/8) & (dw < np.pi/2)) |
+            ((dw < -1.5*np.pi) & (dw >= -2*np.pi+np.pi/8)))
+    right = (((dw > 1.5*np.pi) & (dw <= 2*np.pi - np.pi/8)) |
+             ((dw <= -np.pi/8) & (dw > -np.pi/2)))
 
-        if ((dw >= np.pi/8 and dw < np.pi/2) or
-                (dw < -1.5*np.pi and dw >= -2*np.pi+np.pi/8)):
-          SL = max(S, SL)
-          # SL += S
-        elif ((dw > 1.5*np.pi and dw <= 2*np.pi - np.pi/8) or
-                (dw <= -np.pi/8 and dw > -np.pi/2)):
-          SR = max(S, SR)
-          # SR += S
+    # Each sensor responds to the closest object in its field
+    SL = np.zeros(shape)
+    SR = np.zeros(shape)
+    np.maximum.at(SL.reshape(-1), robot[left], S[left])
+    np.maximum.at(SR.reshape(-1), robot[right], S[right])
 
-    return SL, SR
+    return SL[()], SR[()]
 
@@ -0,0 +1,134 @@
+"""
+Computational Neurodynamics
+Exercise 2
+
+(C) Murray Shanahan et al, 2015
+"""
+
+import numpy as np
+import matplotlib.pyplot as plt
+import time
+
+
+class RobotDashboard(object):
+  """
+  Live plots of a robot simulation: the membrane potentials of the four
+  layers of the controller during the last robot step, and the trajectory of
+  the robot in its environment.
+
+  The figures are drawn once. Each frame only updates the data of the lines
+  and redraws them over a saved background (blitting), and frames come at
+  most fps times per second of wall clock time, so plotting does not slow
+  down the simulation.
+  """
+
+  titles = ['Left sensory neurons', 'Right sensory neurons',
+            'Left motor neurons', 'Right motor neurons']
+
+  def __init__(self, Env, sizes, dt, fps=10):
+    """
+    Inputs:
+    Env   -- Environment the robot runs around in
+    sizes -- Number of neurons of each of the four layers
+    dt    -- Robot step size in milliseconds
+    fps   -- Maximum number of frames per second
+    """
+
+    self.fps  = fps
+    self.last = None
+
+    # Plot membrane potential
+    self.potentials = plt.figure(1)
+    animated = self.potentials.canvas.supports_blit
+    self.axes  = []
+    self.lines = []
+    for lr in xrange(4):
+      ax = self.potentials.add_subplot(221 + lr)
+      ax.set_title(self.titles[lr])
+      ax.set_xlim(0, dt)
+      ax.set_ylim(-90, 40)
+      if lr % 2 == 0:
+        ax.set_ylabel('Membrane potential (mV)')
+      if lr >= 2:
+        ax.set_xlabel('Time (ms)')
+
+      self.axes.append(ax)
+      self.lines.append(ax.plot(np.zeros([dt, sizes[lr]]), animated=animated))
+
+    # Draw Environment
+    self.environment = plt.figure(2)
+    animated = self.environment.canvas.supports_blit
+    ax = self.environment.add_subplot(111)
+    ax.set_xlim(0, Env.xmax)
+    ax.set_ylim(0, Env.ymax)
+    ax.set_title('Robot controlled by spiking neurons')
+    ax.set_xlabel('X')
+    ax.set_ylabel('Y')
+    ax.scatter(Env.x, Env.y, s=np.pi*(Env.r**2), c='lime')
+
+    self.trajectory = ax.plot([], [], '.', animated=animated)[0]
+    self.axes.append(ax)
+
+    # Backgrounds of the axes without the animated lines, saved after every
+    # full draw of a figure (e.g. when a window is resized). Canvases that
+    # cannot blit redraw the whole figure instead.
+    self.backgrounds = {}
+    for figure in [self.potentials, self.environment]:
+      figure.canvas.mpl_connect('draw_event', self.SaveBackgrounds)
+
+    # Interactive mode is not used, as it would redraw a whole figure every
+    # time the data of a line changes.
+    plt.show(block=False)
+
+    for figure in [self.potentials, self.environment]:
+      figure.canvas.draw()
+
+  def SaveBackgrounds(self, event):
+    for ax in self.axes:
+      if ax.figure.canvas is event.canvas:
+        self.backgrounds[ax] = event.canvas.copy_from_bbox(ax.bbox)
+
+  def Update(self, v, x, y, force=False):
+    """
+    Show the membrane potentials v (a dictionary with a (dt, N) array per
+    layer) and the trajectory x, y, unless the last frame was less than
+    1/fps seconds ago.
+
+    Inputs:
+    v     -- Membrane potentials of the last robot step
+    x, y  -- Positions of the robot so far
+    force -- Draw the frame anyway, e.g. for the last robot step
+    """
+
+    now = time.time()
+    if not force and self.last is not None and now - self.last < 1.0/self.fps:
+      return
+    self.last = now
+
+    for lr in xrange(4):
+      for (n, line) in enumerate(self.lines[lr]):
+        line.set_ydata(v[lr][:, n])
+      self.Blit(self.axes[lr], self.lines[lr])
+
+    self.trajectory.set_data(x, y)
+    self.Blit(self.axes[4], [self.trajectory])
+
+    for figure in [self.potentials, self.environment]:
+      figure.canvas.flush_events()
+
+  def Blit(self, ax, artists):
+    """
+    Redraw the given artists of an axes over its saved background.
+    """
+
+    canvas = ax.figure.canvas
+
+    if not canvas.supports_blit or ax not in self.backgrounds:
+      canvas.draw_idle()
+      return
+
+    canvas.restore_region(self.backgrounds[ax])
+    for artist in artists:
+      ax.draw_artist(artist)
+    canvas.blit(ax.bbox)
+
@@ -0,0 +1,166 @@
+"""
+Computational Neurodynamics
+Exercise 2
+
+(C) Murray Shanahan et al, 2015
+"""
+
+import numpy as np
+import numpy.random as rn
+from IzNetwork import IzEnsemble, RateMonitor
+from RobotUpdate import RobotUpdate
+
+
+class RobotPopulation(object):
+  """
+  Several robots running around the same environment, each controlled by its
+  own network. The networks are built like RobotConnect4L, with layers 0 and
+  1 the left and right sensory neurons and layers 2 and 3 the left and right
+  motor neurons, but their sizes and connections may differ.
+
+  All controllers are simulated as one IzEnsemble, and the sensors, inputs,
+  motor firing rates and movements of all robots are computed as arrays, so
+  every robot advances in the same vectorised step.
+  """
+
+  def __init__(self, Env, nets, x=0, y=0, w=np.pi/4, dt=100, Rmax=40,
+               Umin=0.025, threads=1):
+    """
+    Inputs:
+    Env     -- Environment the robots run around in
+    nets    -- List with the controller network of each robot
+    x, y, w -- Initial position and orientation, for all robots or as arrays
+               with one entry per robot
+    dt      -- Robot step size in milliseconds
+    Rmax    -- Estimated peak motor firing rate in Hz
+    Umin    -- Minimum wheel velocity in cm/ms
+    threads -- Number of threads of the ensemble, see IzNetwork
+    """
+
+    assert all(net.Nlayers == 4 for net in nets), 'controllers must have 4 layers'
+
+    self.Env  = Env
+    self.R    = len(nets)
+    self.dt   = dt
+    self.Rmax = Rmax
+    self.Umin = Umin
+    self.Umax = Umin + Umin/6.0  # Maximum wheel velocity
+
+    ## Initialise layers
+    for net in nets:
+      for lr in xrange(net.Nlayers):
+        net.layer[lr].v = -65 * np.ones(net.layer[lr].N)
+        net.layer[lr].u = net.layer[lr].b * net.layer[lr].v
+
+    self.net = IzEnsemble(nets, threads)
+
+    # Only the motor firing rates are used, so the spikes of the last robot
+    # step are enough
+    self.net.history = dt
+
+    # Global indices of the neurons of layer k of every robot, and the robot
+    # each of them belongs to
+    def Neurons(k):
+      offset = self.net.offset
+      index = [np.arange(offset[4*i + k], offset[4*i + k + 1]) for i in xrange(self.R)]
+      robot = np.repeat(np.arange(self.R), [len(n) for n in index])
+      return (np.concatenate(index), robot)
+
+    (self.left, self.left_robot)   = Neurons(0)
+    (self.right, self.right_robot) = Neurons(1)
+    (motor_left, robot_left)       = Neurons(2)
+    (motor_right, robot_right)     = Neurons(3)
+
+    self.motor = np.concatenate([motor_left, motor_right])
+
+    # Motor firing rates are counted by a monitor with one group per motor
+    # layer: 2*i for the left and 2*i + 1 for the right of robot i.
+    group = -np.ones(self.net.offset[-1], dtype=int)
+    group[motor_left]  = 2*robot_left
+    group[motor_right] = 2*robot_right + 1
+
+    self.motor_size = np.bincount(group[group >= 0])
+    self.rates = RateMonitor(group, [dt], dt)
+    self.net.monitors.append(self.rates)
+
+    # Current position and orientation of each robot
+    self.x = np.zeros(self.R) + x
+    self.y = np.zeros(self.R) + y
+    self.w = np.zeros(self.R) + w
+
+    # Record of positions, orientations and sensor activities, one array
+    # per robot step
+    self.X  = [self.x]
+    self.Y  = [self.y]
+    self.W  = [self.w]
+    self.SL = []
+    self.SR = []
+
+  def Step(self):
+    """
+    Simulate all robots for one robot step of dt milliseconds.
+    """
+
+    # Input from Sensors
+    SL, SR = self.Env.GetSensors(self.x, self.y, self.w)
+
+    I = self.net.I
+    for t2 in xrange(self.dt):
+      # Deliver stimulus as a Poisson spike stream
+      I[self.left]  = rn.poisson(SL[self.left_robot]*15)
+      I[self.right] = rn.poisson(SR[self.right_robot]*15)
+
+      # Deliver noisy base current
+      I[self.motor] = 5*rn.randn(len(self.motor))
+
+      # Update network
+      self.net.Update()
+
+    # Output to motors
+    # Calculate motor firing rates in Hz
+    rate = self.rates.means[self.dt][-1] / self.motor_size * 1000
+    RL = rate[0::2]
+    RR = rate[1::2]
+
+    # Set wheel velocities (as fractions of Umax)
+    UL = (self.Umin/self.Umax + RL/self.Rmax*(1 - self.Umin/self.Umax))
+    UR = (self.Umin/self.Umax + RR/self.Rmax*(1 - self.Umin/self.Umax))
+
+    # Update Environment
+    self.x, self.y, self.w = RobotUpdate(self.x, self.y, self.w, UL, UR, self.Umax,
+                                         self.dt, self.Env.xmax, self.Env.ymax)
+
+    self.X.append(self.x)
+    self.Y.append(self.y)
+    self.W.append(self.w)
+    self.SL.append(SL)
+    self.SR.append(SR)
+
+  def Run(self, Tmax):
+    """
+    Simulate all robots for Tmax milliseconds, in robot steps of dt.
+    """
+
+    for t in xrange(Tmax // self.dt):
+      self.Step()
+
+  def Close(self):
+    """
+    Stop the threads of the ensemble, if any.
+    """
+    self.net.Close()
+
+  def Trajectory(self):
+    """
+    Return the recorded x, y and w as (robots, steps + 1) arrays.
+    """
+    return (np.array(self.X).T, np.array(self.Y).T, np.array(self.W).T)
+
+  def Sensors(self):
+    """
+    Return the recorded activities of the left and right sensors as
+    (robots, steps) arrays.
+    """
+    return (np.array(self.SL).T.reshape(self.R, -1),
+            np.array(self.SR).T.reshape(self.R, -1))
+
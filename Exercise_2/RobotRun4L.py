@@ -6,16 +6,22 @@ Simulates the movement of a robot with differential wheels under the
 control of a spiking neural network. The simulation runs for a very
 long time --- if you get bored, press Ctrl+C a couple of times.
 
+Run with --headless to simulate without plotting. The trajectory and the
+spikes of the robot are then saved to RobotRun4L.npz.
+
 (C) Murray Shanahan et al, 2015
 """
 
 import numpy as np
 import numpy.random as rn
-import matplotlib.pyplot as plt
+import sys
 from Environment import Environment
 from RobotConnect4L import RobotConnect4L
 from RobotUpdate import RobotUpdate
 
+# Only record the trajectory and spikes, without plotting
+headless = '--headless' in sys.argv
+
 
 ## Create the environment
 print 'Initialising environment'
@@ -29,7 +35,6 @@ Ns = 4  # Sensor neurons. Try 1, 4, and 8
 Nm = 4  # Motor neurons. Try 1, 4, and 8
 net  = RobotConnect4L(Ns, Nm)
 
-Dmax = 5      # Maximum synaptic delay
 Ib   = 30     # Base current
 Rmax = 40     # Estimated peak motor firing rate in Hz
 Umin = 0.025  # Minimum wheel velocity in cm/ms
@@ -45,11 +50,19 @@ for lr in xrange(net.Nlayers):
 Tmax = 20000  # Simulation time in milliseconds
 dt   = 100    # Robot step size in milliseconds
 
+# The network only has to keep the spikes of the last robot step
+net.history = dt
+
 # Initialise record of membrane potentials
 v = {}
 for lr in xrange(net.Nlayers):
   v[lr] = np.zeros([dt, net.layer[lr].N])
 
+# Initialise record of spikes, one array per robot step and layer
+spikes = {}
+for lr in xrange(net.Nlayers):
+  spikes[lr] = []
+
 
 # Initialise record of robot positions
 T = np.arange(0, Tmax, dt)
@@ -68,17 +81,9 @@ L  = net.Nlayers
 print 'Preparing Simulation'
 
 # Draw Environment
-plt.figure(2)
-plt.xlim(0, xmax)
-plt.ylim(0, ymax)
-plt.title('Robot controlled by spiking neurons')
-plt.xlabel('X')
-plt.ylabel('Y')
-for Ob in Env.Obs:
-  plt.scatter(Ob['x'], Ob['y'], s=np.pi*(Ob['r']**2), c='lime')
-
-plt.ion()
-plt.show()
+if not headless:
+  from RobotDashboard import RobotDashboard
+  dashboard = RobotDashboard(Env, [N0, N1, N2, N3], dt)
 
 
 ## SIMULATE
@@ -88,17 +93,6 @@ for t in xrange(len(T)):
   # SL, SR = RobotGetSensors(Env, x[t], y[t], w[t], xmax, ymax)
   SL, SR = Env.GetSensors(x[t], y[t], w[t])
 
-  # Carry over firings that might not have reached their targets yet
-  for lr in xrange(L):
-    firings = []
-    for f in net.layer[lr].firings:
-      # discard all earlier firings
-      if f[0] > dt-Dmax:
-        # also decrease the time so that it is in -Dmax to -1
-        f[0] = f[0] - dt
-        firings.append(f)
-    net.layer[lr].firings = np.array(firings)
-
   for t2 in xrange(dt):
     # Deliver stimulus as a Poisson spike stream
     net.layer[0].I = rn.poisson(SL*15, N0)
@@ -108,31 +102,32 @@ for t in xrange(len(T)):
     net.layer[2].I = 5*rn.randn(N2)
     net.layer[3].I = 5*rn.randn(N3)
 
-    # Update network
-    net.Update(t2)
+    # Update network. Its clock keeps counting across robot steps, so spikes
+    # still on their way are delivered in the next step.
+    net.Update(t*dt + t2)
 
     # Maintain record of membrane potential
-    for lr in xrange(L):
-      v[lr][t2, :] = net.layer[lr].v
+    if not headless:
+      for lr in xrange(L):
+        v[lr][t2, :] = net.layer[lr].v
 
-  # Discard carried over firings with time less than 0
+  # Spikes of this step, with times from 0 to dt-1
+  firings = {}
   for lr in xrange(L):
-    firings = []
-    for f in net.layer[lr].firings:
-      if f[0] > 0:
-        firings.append(f)
-    net.layer[lr].firings = np.array(firings)
+    firings[lr] = net.RecentFirings(lr, dt)
 
-  # Add Dirac pluses (mainly for presentation)
+  # Keep the spikes of this step with their time since the start
   for lr in xrange(L):
-    firings = net.layer[lr].firings
-    if firings.size != 0:
-      v[lr][firings[:, 0], firings[:, 1]] = 30
+    spikes[lr].append(firings[lr] + [t*dt, 0])
+
+    # Add Dirac pluses (mainly for presentation)
+    if firings[lr].size != 0 and not headless:
+      v[lr][firings[lr][:, 0], firings[lr][:, 1]] = 30
 
   # Output to motors
   # Calculate motor firing rates in Hz
-  RL = 1.0*len(net.layer[2].firings)/dt/N2*1000
-  RR = 1.0*len(net.layer[3].firings)/dt/N3*1000
+  RL = 1.0*len(firings[2])/dt/N2*1000
+  RR = 1.0*len(firings[3])/dt/N3*1000
 
   # Set wheel velocities (as fractions of Umax)
   UL = (Umin/Umax + RL/Rmax*(1 - Umin/Umax))
@@ -143,39 +138,16 @@ for t in xrange(len(T)):
                                        Umax, dt, xmax, ymax)
 
   ## PLOTTING
-  # Plot membrane potential
-  plt.figure(1)
-  plt.clf()
-
-  plt.subplot(221)
-  plt.plot(v[0])
-  plt.subplot(221)
-  plt.title('Left sensory neurons')
-  plt.ylabel('Membrane potential (mV)')
-  plt.ylim(-90, 40)
-
-  plt.subplot(222)
-  plt.plot(v[1])
-  plt.title('Right sensory neurons')
-  plt.ylim(-90, 40)
-
-  plt.subplot(223)
-  plt.plot(v[2])
-  plt.title('Left motor neurons')
-  plt.ylabel('Membrane potential (mV)')
-  plt.ylim(-90, 40)
-  plt.xlabel('Time (ms)')
-
-  plt.subplot(224)
-  plt.plot(v[3])
-  plt.title('Right motor neurons')
-  plt.ylim(-90, 40)
-  plt.xlabel('Time (ms)')
-
-  plt.draw()
-
-  # Plot robot trajectory
-  plt.figure(2)
-  plt.scatter(x, y, marker='.')
-  plt.draw()
+  # Plot membrane potential and robot trajectory, at most a few times per
+  # second
+  if not headless:
+    dashboard.Update(v, x[:t+2], y[:t+2], force=(t == len(T) - 1))
+
+## SAVE
+if headless:
+  record = {}
+  for lr in xrange(L):
+    record['firings%d' % lr] = np.concatenate(spikes[lr])
+  np.savez('RobotRun4L.npz', x=x, y=y, w=w, **record)
+  print 'Saved trajectory and spikes to RobotRun4L.npz'
 
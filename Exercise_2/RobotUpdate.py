@@ -13,7 +13,8 @@ def RobotUpdate(x1, y1, w1, UL, UR, Umax, dt, xmax, ymax):
   Updates the position (x1,y1) and orientation w1 of the robot given
   wheel velocities UL (left) and UR (right), where Umax is the maximum
   wheel velocity, dt is the step size, and xmax and ymax are the limits of
-  the torus.
+  the torus. All inputs but Umax, dt, xmax and ymax can also be arrays
+  with one entry per robot, in which case the outputs are arrays too.
 
   Outputs:
   x2, y2, w2 -- New position and orientation of the robot.
@@ -34,17 +35,11 @@ def RobotUpdate(x1, y1, w1, UL, UR, Umax, dt, xmax, ymax):
   w2 = w1 + dt*dw
 
   w2 = np.mod(w2+np.pi, 2*np.pi) - np.pi
-  if w2 < 0:
-    w2 = 2*np.pi + w2
+  w2 = np.where(w2 < 0, 2*np.pi + w2, w2)
 
-  if x2 > xmax:
-    x2 = x2 - xmax
-  if y2 > ymax:
-    y2 = y2 - ymax
-  if x2 < 0:
-    x2 = xmax + x2
-  if y2 < 0:
-    y2 = ymax + y2
-
-  return x2, y2, w2
+  x2 = np.where(x2 > xmax, x2 - xmax, x2)
+  y2 = np.where(y2 > ymax, y2 - ymax, y2)
+  x2 = np.where(x2 < 0, xmax + x2, x2)
+  y2 = np.where(y2 < 0, ymax + y2, y2)
 
+  return x2[()], y2[()], w2[()]
@@ -0,0 +1,46 @@
+"""
+Computational Neurodynamics
+Exercise 2
+
+Simulates the two QIF layers of RunQIF2L with the numpy and the numba
+backend and checks that both produce the same spikes. Run with the
+Exercise_2 directory in PYTHONPATH.
+
+(C) Murray Shanahan et al, 2015
+"""
+
+from ConnectQIF2L import ConnectQIF2L
+import numpy as np
+import numpy.random as rn
+
+N1 = 40
+N2 = 40
+T  = 2000  # Simulation time
+Ib = 15    # Base current
+
+firings = {}
+
+for backend in ['numpy', 'numba']:
+  rn.seed(0)
+  net = ConnectQIF2L(N1, N2, backend)
+
+  ## Initialise layers
+  for lr in xrange(len(net.layer)):
+    net.layer[lr].v = -65
+    net.layer[lr].firings = np.array([])
+
+  ## SIMULATE
+  for t in xrange(T):
+    # Deliver a noisy base current to layer 1
+    net.layer[0].I = Ib * np.ones(N1) + 5*rn.randn(N1)
+    net.layer[1].I = np.zeros(N2)
+
+    net.Update(t)
+
+  firings[backend] = net.Firings()
+  print backend, len(firings[backend]), 'spikes'
+
+assert np.array_equal(firings['numpy'], firings['numba']), \
+  'backends give different spikes'
+print 'Both backends give the same spikes.'
+
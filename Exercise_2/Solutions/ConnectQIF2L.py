@@ -10,21 +10,22 @@ import numpy as np
 import numpy.random as rn
 
 
-def ConnectQIF2L(N0, N1):
+def ConnectQIF2L(N0, N1, backend='numpy'):
   """
   Constructs two layers of QIF neurons and connects them together.  Pretty much
   like Connect2L, but with QIF instead of Izhikevich neurons. Layers are
   arrays of N neurons.
 
   Inputs:
-  N0, N1 -- Number of neurons in layer 0 and 1, respectively
+  N0, N1  -- Number of neurons in layer 0 and 1, respectively
+  backend -- 'numpy' or 'numba' integration, see IzNetwork
   """
 
   F = 60/np.sqrt(N1)  # Scaling factor
   D = 5               # Conduction delay
   Dmax = 10           # Maximum conduction delay
 
-  net = QIFNetwork([N0, N1], Dmax)
+  net = QIFNetwork([N0, N1], Dmax, _backend=backend)
 
   # Neuron parameters
   # Each layer comprises a heterogenous set of neurons, with a small spread
@@ -1,12 +1,21 @@
 import numpy as np
 
+# IzNetwork is in the Exercise_2 directory, which must be in PYTHONPATH
+from IzNetwork import IzNetwork, IzLayer, StateVariable, HAVE_NUMBA
 
-class QIFNetwork:
+if HAVE_NUMBA:
+  import numba
+
+
+class QIFNetwork(IzNetwork):
   """
-  Network of quadratic integrate-and-fire neurons.
+  Network of quadratic integrate-and-fire neurons. Spike delivery, recording
+  and the engine and backend options are those of IzNetwork; only the
+  neuron model is different.
   """
 
-  def __init__(self, _neuronsPerLayer, _Dmax):
+  def __init__(self, _neuronsPerLayer, _Dmax, _engine='dense', _backend='numpy',
+               _threads=1, _precision='double'):
     """
     Initialise network with given number of neurons
 
@@ -15,116 +24,100 @@ class QIFNetwork:
                         [N1, N2, ... Nk] will return a network with k layers
                         with the corresponding number of neurons in each.
 
-    _Dmax            -- Maximum delay in all the synapses in the network. Any
-                        longer delay will result in failing to deliver spikes.
-    """
+    _Dmax            -- Maximum delay in all the synapses in the network. Only
+                        delays from 1 to Dmax-1 deliver spikes; any longer
+                        delay will result in failing to deliver spikes.
 
-    self.Dmax = _Dmax
-    self.Nlayers = len(_neuronsPerLayer)
+    _engine          -- 'dense' or 'sparse' spike delivery. See IzNetwork.
 
-    self.layer = {}
+    _backend         -- 'numpy' or 'numba' integration. See IzNetwork.
 
-    for i, n in enumerate(_neuronsPerLayer):
-      self.layer[i] = QIFLayer(n)
+    _threads         -- Number of threads. See IzNetwork.
 
-  def Update(self, t):
+    _precision       -- 'double' or 'single' precision. See IzNetwork.
     """
-    Run simulation of the whole network for 1 millisecond and update the
-    network's internal variables.
 
-    Inputs:
-    t -- Current timestep. Necessary to sort out the synaptic delays.
-    """
-    for lr in xrange(self.Nlayers):
-      self.NeuronUpdate(lr, t)
+    IzNetwork.__init__(self, _neuronsPerLayer, _Dmax, _engine, _backend, _threads,
+                       _precision)
 
-  def NeuronUpdate(self, i, t):
+  def NewLayer(self, n):
+    """
+    Return an empty layer of n QIF neurons.
     """
-    QIF neuron update function. Update one layer for 1 millisecond
-    using the Euler method.
+    return QIFLayer(n, self.Dmax)
 
-    Inputs:
-    i -- Number of layer to update
-    t -- Current timestep. Necessary to sort out the synaptic delays.
+  def Kernel(self):
+    """
+    Return the QIF Euler kernel of the network's backend and the list of
+    vectors it takes.
     """
 
-    # Euler method step size in ms
-    dt = 0.2
+    if self.backend == 'numba':
+      euler = _QIFEulerNumba
+    else:
+      euler = _QIFEulerNumpy
 
-    # Calculate current from incoming spikes
-    for j in xrange(self.Nlayers):
+    return (euler, [self.v, self.R, self.tau, self.vr, self.vc, self.a, self.I])
 
-      # If layer[i].S[j] exists then layer[i].factor[j] and
-      # layer[i].delay[j] have to exist
-      if j in self.layer[i].S:
-        S = self.layer[i].S[j]  # target neuron->rows, source neuron->columns
 
-        # Firings contains time and neuron idx of each spike.
-        # [t, index of the neuron in the layer j]
-        firings = self.layer[j].firings
+class QIFLayer(IzLayer):
+  """
+  Layer of quadratic integrate-and-fire neurons to be used inside an
+  QIFNetwork. R, tau, vr, vc and a can be given either per neuron or as a
+  single value for the whole layer.
+  """
 
-        # Find incoming spikes taking delays into account
-        delay = self.layer[i].delay[j]
-        F = self.layer[i].factor[j]
+  variables = ['v', 'R', 'tau', 'vr', 'vc', 'a', 'I']
 
-        # Sum current from incoming spikes
-        k = len(firings)
-        while k > 0 and (firings[k-1, 0] > (t - self.Dmax)):
-          idx = delay[:, firings[k-1, 1]] == (t-firings[k-1, 0])
-          self.layer[i].I[idx] += F * S[idx, firings[k-1, 1]]
-          k = k-1
+  R   = StateVariable('R')
+  tau = StateVariable('tau')
+  vr  = StateVariable('vr')
+  vc  = StateVariable('vc')
 
-    # Update v using the QIF equations and Euler method
-    for k in xrange(int(1/dt)):
-      v = self.layer[i].v
 
-      self.layer[i].v += dt*(
-          self.layer[i].a*(self.layer[i].vr - v)*(self.layer[i].vc - v) +
-          self.layer[i].R*self.layer[i].I) / self.layer[i].tau
+def _QIFEulerNumpy(v, R, tau, vr, vc, a, I, dt, steps):
+  """
+  Reference QIF kernel. Run the given number of Euler steps on the vector v
+  in place and return the indices of the neurons that fired in each step,
+  one step after another, and the number of spikes per step.
+  """
 
-      # Find index of neurons that have fired this millisecond
-      fired = np.where(self.layer[i].v >= 30)[0]
+  fired = []
+  for k in xrange(steps):
+    v += dt*(a*(vr - v)*(vc - v) + R*I) / tau
 
-      if len(fired) > 0:
-        for f in fired:
-          # Add spikes into spike train
-          if len(self.layer[i].firings) != 0:
-            self.layer[i].firings = np.vstack([self.layer[i].firings, [t, f]])
-          else:
-            self.layer[i].firings = np.array([[t, f]])
+    # Find index of neurons that have fired this millisecond
+    fired.append(np.where(v >= 30)[0])
 
-          # Reset the membrane potential after spikes
-          # Here's a little hack to see if vr is array or scalar
-          if hasattr(self.layer[i].vr, "__len__"):
-            self.layer[i].v[f]  = self.layer[i].vr[f]
-          else:
-            self.layer[i].v[f]  = self.layer[i].vr
+    # Reset the membrane potential after spikes
+    v[fired[k]] = vr[fired[k]]
 
-    return
+  return (np.concatenate(fired), np.array([len(f) for f in fired]))
 
 
-class QIFLayer:
-  """
-  Layer of quadratic integrate-and-fire neurons to be used inside an
-  QIFNetwork.
-  """
+if HAVE_NUMBA:
 
-  def __init__(self, n):
+  @numba.njit(cache=True, nogil=True)
+  def _QIFEulerNumba(v, R, tau, vr, vc, a, I, dt, steps):
     """
-    Initialise layer with empty vectors.
-
-    Inputs:
-    n -- Number of neurons in the layer
+    Compiled version of _QIFEulerNumpy with identical results.
     """
 
-    self.N   = n
-    self.R   = np.zeros(n)
-    self.tau = np.zeros(n)
-    self.vr  = np.zeros(n)
-    self.vc  = np.zeros(n)
-    self.a   = np.zeros(n)
+    fired = np.empty(steps * len(v), dtype=np.int64)
+    counts = np.zeros(steps, dtype=np.int64)
+    n = 0
+
+    for k in range(steps):
+      for i in range(len(v)):
+        vi = v[i]
+        v[i] = vi + dt*(a[i]*(vr[i] - vi)*(vc[i] - vi) + R[i]*I[i]) / tau[i]
+
+        if v[i] >= 30:
+          fired[n] = i
+          n += 1
+          counts[k] += 1
+
+          v[i] = vr[i]
 
-    self.S      = {}
-    self.delay  = {}
-    self.factor = {}
+    return (fired[:n], counts)
 
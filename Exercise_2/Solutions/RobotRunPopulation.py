@@ -0,0 +1,77 @@
+"""
+Computational Neurodynamics
+Exercise 2
+
+Simulates a population of robots with different controllers in the same
+environment: seeking (RobotConnect4L) and avoidance
+(RobotConnectAvoidance) controllers with 1, 4 and 8 sensory and motor
+neurons, several robots each, all advanced together by a RobotPopulation.
+Run with the Exercise_2 directory in PYTHONPATH.
+
+(C) Murray Shanahan et al, 2015
+"""
+
+import numpy as np
+import numpy.random as rn
+import matplotlib.pyplot as plt
+from Environment import Environment
+from RobotConnect4L import RobotConnect4L
+from RobotConnectAvoidance import RobotConnectAvoidance
+from RobotPopulation import RobotPopulation
+
+
+## Create the environment
+print 'Initialising environment'
+xmax = 100
+ymax = 100
+Env = Environment(15, 10, 20, xmax, ymax)
+
+## Robot controllers
+print 'Initialising Robot Controllers'
+variants = [(name, connect, N) for (name, connect) in [('Seeking', RobotConnect4L),
+                                                      ('Avoidance', RobotConnectAvoidance)]
+                               for N in [1, 4, 8]]
+copies = 5  # Robots of each variant
+
+nets = []
+variant = []
+for (v, (name, connect, N)) in enumerate(variants):
+  for c in xrange(copies):
+    nets.append(connect(N, N))
+    variant.append(v)
+variant = np.array(variant)
+
+# All robots start at random positions and orientations
+R = len(nets)
+pop = RobotPopulation(Env, nets, rn.rand(R)*xmax, rn.rand(R)*ymax, rn.rand(R)*2*np.pi)
+
+# Simulation parameters
+Tmax = 20000  # Simulation time in milliseconds
+
+## SIMULATE
+print 'Start Simulation'
+pop.Run(Tmax)
+
+## RESULTS
+# Seeking robots should spend more time with objects in sight than avoiding
+# ones
+x, y, w = pop.Trajectory()
+SL, SR = pop.Sensors()
+sight = (SL + SR > 0).mean(1)
+
+for (v, (name, connect, N)) in enumerate(variants):
+  print '%-9s Ns = Nm = %d: objects in sight %4.1f%% of the time' % (
+    name, N, 100*sight[variant == v].mean())
+
+plt.figure(1)
+plt.xlim(0, xmax)
+plt.ylim(0, ymax)
+plt.title('Robots controlled by spiking neurons')
+plt.xlabel('X')
+plt.ylabel('Y')
+plt.scatter(Env.x, Env.y, s=np.pi*(Env.r**2), c='lime')
+for (v, (name, connect, N)) in enumerate(variants):
+  plt.scatter(x[variant == v], y[variant == v], marker='.',
+              c=('r' if name == 'Seeking' else 'b'), s=4*N)
+plt.show()
+
@@ -4,7 +4,7 @@ Exercise 2
 
 Simulates two layers of Izhikevich neurons. Layer 0 is stimulated
 with a constant base current and layer 1 receives synaptic input
-of layer 0.
+of layer 0. Run with the Exercise_2 directory in PYTHONPATH.
 
 (C) Murray Shanahan et al, 2015
 """
@@ -6,9 +6,10 @@ Exercise 3
 """
 
 import numpy as np
+import scipy.sparse as sp
 
 
-def NetworkRingLattice(N, k):
+def NetworkRingLattice(N, k, sparse=False):
   """
   Creates a ring lattice with N nodes and neighbourhood size k.
   Choosing k = 2 connects each node to its nearest 2 nodes, k = 4
@@ -18,22 +19,63 @@ def NetworkRingLattice(N, k):
   You technically can choose k > N, but that will give you just a
   fully connected net.
 
+  Inputs:
+  N      -- Number of nodes
+  k      -- Neighbourhood size of the initial ring lattice
+  sparse -- Return a scipy.sparse CSR matrix instead of a dense array
+  """
+
+  (i, j) = RingLatticeEdges(N, k)
+
+  return EdgesToMatrix(N, i, j, sparse)
+
+
+def RingLatticeEdges(N, k):
+  """
+  Returns the edges of a ring lattice with N nodes and neighbourhood
+  size k as two arrays (i, j), with each undirected edge listed once.
+  Node i is connected to the nodes i+1 to i+k/2 (modulo N).
+
   Inputs:
   N -- Number of nodes
-  k -- Neighbourhood size of the initial ring lattice
+  k -- Neighbourhood size of the ring lattice
   """
 
-  # Create empty connectivity matrix
-  CIJ = np.zeros([N, N])
+  # Beyond N/2 the neighbours on both sides are the same nodes
+  h = min(int(k // 2), N // 2)
+
+  i = np.repeat(np.arange(N), h)
+  j = (i + np.tile(np.arange(1, h + 1), N)) % N
+
+  # With an even N the node N/2 away is reached from both sides
+  if N % 2 == 0 and h == N // 2:
+    keep = ((j - i) % N != N // 2) | (i < j)
+    (i, j) = (i[keep], j[keep])
+
+  return (i, j)
+
+
+def EdgesToMatrix(N, i, j, sparse=False):
+  """
+  Returns the symmetric binary connectivity matrix of an undirected
+  graph with N nodes and edges (i, j). Edges listed more than once are
+  only connected once.
+
+  Inputs:
+  N      -- Number of nodes
+  i, j   -- Arrays with the two nodes of each edge
+  sparse -- Return a scipy.sparse CSR matrix instead of a dense array
+  """
+
+  rows = np.concatenate([i, j])
+  cols = np.concatenate([j, i])
+
+  CIJ = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(N, N))
+  CIJ.sum_duplicates()
+  CIJ.data[:] = 1
 
-  # Loop through the nodes and connect the neighbourhoods
-  for i in range(N):
-    # Note that since the network is undirected (symmetric) we only
-    # need to look at the upper triangular bit of CIJ.
-    for j in range(i+1, N):
-      if i != j and min(abs(i-j), N - abs(i-j)) <= k/2.0:
-        CIJ[i, j] = 1
-        CIJ[j, i] = 1
+  if sparse:
+    return CIJ
 
-  return(CIJ)
+  return CIJ.toarray()
 
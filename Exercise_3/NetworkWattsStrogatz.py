@@ -5,38 +5,33 @@ Exercise 3
 (C) Murray Shanahan et al, 2015
 """
 
-import numpy as np
 import numpy.random as rn
-from NetworkRingLattice import NetworkRingLattice
+from NetworkRingLattice import RingLatticeEdges, EdgesToMatrix
 
 
-def NetworkWattsStrogatz(N, k, p):
+def NetworkWattsStrogatz(N, k, p, sparse=False):
   """
   Creates a ring lattice with N nodes and neighbourhood size k, then
   rewires it according to the Watts-Strogatz procedure with probability p.
 
+  Every edge (i, j) of the lattice is rewired with probability p to (i, h),
+  with h drawn uniformly from all nodes but i. All edges are rewired at once,
+  so building the network takes time and memory proportional to N*k. A
+  rewired edge that lands on an existing one is merged with it.
+
   Inputs:
-  N -- Number of nodes
-  k -- Neighbourhood size of the initial ring lattice
-  p -- Rewiring probability
+  N      -- Number of nodes
+  k      -- Neighbourhood size of the initial ring lattice
+  p      -- Rewiring probability
+  sparse -- Return a scipy.sparse CSR matrix instead of a dense array
   """
 
   # Create a regular string lattice
-  CIJ = NetworkRingLattice(N, k)
-
-  # Loop over all connections and swap each of them with probability p
-  for i in range(N):
-    for j in range(i+1, N):
-      if CIJ[i, j] and rn.random() < p:
-        # We modify connections in both directions (i.e. [i,j] and [j,i])
-        # to maintain network undirectedness (i.e. symmetry).
-        CIJ[i, j] = 0
-        CIJ[j, i] = 0
-        # PEDRO
-        # h = np.mod(i + np.ceil(rn.random()*(N-1)) - 1, N)
-        h = int(np.mod(i + np.ceil(rn.random()*(N-1)) - 1, N))
-        CIJ[i, h] = 1
-        CIJ[h, i] = 1
-
-  return(CIJ)
+  (i, j) = RingLatticeEdges(N, k)
+
+  # Swap each connection with probability p
+  rewire = rn.random(len(i)) < p
+  j[rewire] = (i[rewire] + rn.randint(1, N, rewire.sum())) % N
+
+  return EdgesToMatrix(N, i, j, sparse)
 
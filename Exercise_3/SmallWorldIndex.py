@@ -6,36 +6,189 @@ Exercise 3
 """
 
 import numpy as np
-from bct import breadthdist, charpath, clustering_coef_bu
+import numpy.random as rn
+import multiprocessing as mp
+import scipy.sparse as sp
+from scipy.sparse.csgraph import breadth_first_order
 
 
-def SmallWorldIndex(CIJ):
+def SmallWorldIndex(CIJ, samples=None, processes=1, seed=None):
   """
   Computes the small-world index of the graph with connection matrix CIJ.
   Self-connections are ignored, as they are cyclic paths.
 
+  CIJ can be a dense array or a scipy.sparse matrix. The clustering
+  coefficient and the characteristic path length are computed on a sparse
+  matrix (see ClusteringCoefficient and PathLength), so large sparse
+  graphs never need an N x N matrix in memory.
+
   Inputs:
-  CIJ  --  Graph connectivity matrix. Must be binary (0 or 1) and undirected.
+  CIJ       --  Graph connectivity matrix. Must be binary (0 or 1) and
+                undirected.
+  samples   --  Number of randomly chosen nodes to estimate the path length
+                from, or None to use all nodes (exact)
+  processes --  Number of processes the breadth-first searches are split
+                across
+  seed      --  Seed for choosing the sampled nodes
   """
 
-  N = len(CIJ)
-  K = np.sum(np.sum(CIJ))/len(CIJ)  # average degree
+  return SmallWorldMeasures(CIJ, samples, processes, seed)[2]
 
-  # Clustering coefficient
-  CC = np.mean(clustering_coef_bu(CIJ))
 
-  # Distance matrix
-  [RR, DD] = breadthdist(CIJ)
+def SmallWorldMeasures(CIJ, samples=None, processes=1, seed=None):
+  """
+  Computes the mean clustering coefficient CC, the characteristic path
+  length PL and the small-world index SWI of the graph with connection
+  matrix CIJ. The inputs are those of SmallWorldIndex.
+
+  Outputs:
+  CC, PL, SWI -- Clustering coefficient, path length and small-world index
+  """
+
+  A = BinaryGraph(CIJ)
+
+  N = A.shape[0]
+  K = float(A.nnz)/N  # average degree
 
-  # Note: the charpath implementation of bctpy is not very robust. Expect
-  # some warnings. From the output of charpath use only the characteristic
-  # path length
-  PL = charpath(DD, include_diagonal=False)[0]
+  # Clustering coefficient
+  CC = np.mean(ClusteringCoefficient(A))
+
+  # Characteristic path length
+  PL = PathLength(A, samples, processes, seed)
 
   # Calculate small-world index
   CCs = CC/(K/N)
   PLs = PL/(np.log(N)/np.log(K))
   SWI = CCs/PLs
 
-  return(SWI)
+  return (CC, PL, SWI)
+
+
+def BinaryGraph(CIJ):
+  """
+  Returns CIJ as a binary scipy.sparse CSR matrix without self-connections.
+  """
+
+  A = sp.coo_matrix(CIJ)
+  edge = (A.row != A.col) & (A.data != 0)
+
+  A = sp.csr_matrix((np.ones(edge.sum()), (A.row[edge], A.col[edge])), shape=A.shape)
+  A.sum_duplicates()
+  A.data[:] = 1
+
+  return A
+
+
+def ClusteringCoefficient(A):
+  """
+  Returns the clustering coefficient of each node of the binary undirected
+  graph A, the fraction of the pairs of its neighbours that are connected,
+  or 0 for nodes with less than two neighbours. Triangles are counted with
+  sparse matrix products, as the diagonal of A^3.
+
+  Inputs:
+  A -- Binary symmetric scipy.sparse matrix without self-connections
+  """
+
+  k = np.asarray(A.sum(1)).ravel()
+
+  # Each triangle around a node is a closed walk of length 3, in both
+  # directions
+  triangles = np.asarray((A.dot(A)).multiply(A).sum(1)).ravel() / 2.0
+
+  C = np.zeros(len(k))
+  C[k >= 2] = 2*triangles[k >= 2] / (k[k >= 2]*(k[k >= 2] - 1))
+
+  return C
+
+
+def PathLength(A, samples=None, processes=1, seed=None, chunk=None):
+  """
+  Returns the characteristic path length of the graph A, the mean length of
+  the shortest paths between all pairs of different nodes that are
+  connected. Pairs without a path are left out.
+
+  The paths are found by a breadth-first search from every source node,
+  with the sources split into chunks that can be searched in parallel. With
+  samples, only that many randomly chosen sources are searched from, which
+  estimates the path length of graphs too large to search from every node.
+
+  Inputs:
+  A         -- Binary symmetric scipy.sparse matrix without self-connections
+  samples   -- Number of source nodes to sample, or None for all nodes
+  processes -- Number of processes the sources are split across
+  seed      -- Seed for choosing the sampled sources
+  chunk     -- Number of sources searched at once, by default as many as
+               fit about a million distances
+  """
+
+  N = A.shape[0]
+
+  if chunk is None:
+    chunk = max(1, 2**20 // N)
+
+  if samples is None or samples >= N:
+    sources = np.arange(N)
+  else:
+    sources = np.sort(rn.RandomState(seed).choice(N, samples, replace=False))
+
+  chunks = [sources[i:i + chunk] for i in range(0, len(sources), chunk)]
+
+  if processes == 1:
+    _SetGraph(A)
+    results = map(_PathSums, chunks)
+  else:
+    pool = mp.Pool(processes, _SetGraph, (A,))
+    try:
+      results = pool.map(_PathSums, chunks)
+    finally:
+      pool.terminate()
+
+  (total, pairs) = np.sum(results, 0)
+
+  # No two nodes are connected
+  if pairs == 0:
+    return np.nan
+
+  return float(total)/pairs
+
+
+# Graph searched by _PathSums, set once per process
+_graph = None
+
+
+def _SetGraph(A):
+  global _graph
+  _graph = A
+
+
+def _PathSums(sources):
+  """
+  Returns the sum of the finite distances from the given sources to all
+  other nodes of _graph, and the number of those distances.
+  """
+
+  N = _graph.shape[0]
+
+  # The graph is symmetric, so directed searches find the same paths
+  # without transposing the graph for each of them.
+  parent = np.array([breadth_first_order(_graph, source, directed=True)[1]
+                     for source in sources])
+
+  # The distance of each node to its source, by pointer jumping over the
+  # search trees of all sources at once. Nodes are numbered by row, and
+  # depth is the distance to ancestor, which moves twice as far up the tree
+  # each time. The source and the nodes it does not reach are their own
+  # ancestors.
+  row = np.arange(len(sources))[:, None] * N
+  reached = parent >= 0
+
+  ancestor = np.where(reached, parent + row, np.arange(N) + row).ravel()
+  depth = reached.ravel().astype(int)
+
+  while (ancestor[ancestor] != ancestor).any():
+    depth += depth[ancestor]
+    ancestor = ancestor[ancestor]
+
+  return (depth.sum(), reached.sum())
 
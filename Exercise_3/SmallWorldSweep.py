@@ -0,0 +1,194 @@
+"""
+Computational Neurodynamics
+Exercise 3
+
+Computes the clustering coefficient, path length and small-world index of
+ensembles of Watts-Strogatz networks across a range of rewiring
+probabilities, in a pool of processes. Run as a script to sweep 50
+log-spaced probabilities with 100 networks each and plot the results.
+
+(C) Murray Shanahan et al, 2015
+"""
+
+import numpy as np
+import numpy.random as rn
+import multiprocessing as mp
+import signal
+from itertools import imap
+from NetworkRingLattice import NetworkRingLattice
+from NetworkWattsStrogatz import NetworkWattsStrogatz
+from SmallWorldIndex import SmallWorldMeasures
+
+MEASURES = ['CC', 'PL', 'SWI']
+
+# One row per network of a sweep
+TRIAL_DTYPE = np.dtype([('p', 'f8'), ('seed', 'i8')] + [(m, 'f8') for m in MEASURES])
+
+# One row per rewiring probability: number of networks, and the mean and
+# variance of each measure
+SUMMARY_DTYPE = np.dtype([('p', 'f8'), ('n', 'i8')] +
+                         [(m + suffix, 'f8') for m in MEASURES for suffix in ['_mean', '_var']])
+
+
+def SmallWorldSweep(N, k, ps, repeats, processes=None, seed=0, samples=None,
+                    output=None, verbose=True):
+  """
+  Builds repeats Watts-Strogatz networks with N nodes and neighbourhood
+  size k for each rewiring probability in ps, and computes their measures
+  in a pool of processes. The mean and variance of each measure are updated
+  as the results arrive, and printed once all networks of a probability are
+  done.
+
+  Each network has its own seed, derived from seed, so a sweep gives the
+  same results for any number of processes.
+
+  Inputs:
+  N         -- Number of nodes
+  k         -- Neighbourhood size of the initial ring lattice
+  ps        -- List of rewiring probabilities
+  repeats   -- Number of networks per probability
+  processes -- Number of worker processes. Defaults to the number of cores;
+               1 runs everything in this process.
+  seed      -- Seed the seeds of all networks are drawn from
+  samples   -- Number of nodes to estimate the path length from, or None for
+               the exact path length (see PathLength)
+  output    -- File name to save the trials and summary tables to, as a .npz
+               file of two structured arrays, or None not to save them
+  verbose   -- Print the summary of each probability when it is complete
+
+  Outputs:
+  trials  -- Table of the measures of every network (see TRIAL_DTYPE)
+  summary -- Table of the mean and variance of the measures of every
+             probability (see SUMMARY_DTYPE)
+  """
+
+  seeds = rn.RandomState(seed).randint(2**31, size=(len(ps), repeats))
+  tasks = [(n, i, ps[i], seeds[i, r], N, k, samples)
+           for (n, (i, r)) in enumerate((i, r) for i in range(len(ps)) for r in range(repeats))]
+
+  trials = np.zeros(len(tasks), dtype=TRIAL_DTYPE)
+  stats = RunningStats(len(ps), len(MEASURES))
+
+  for (n, i, measures) in _ParallelMap(_Trial, tasks, processes):
+    trials[n] = (ps[i], tasks[n][3]) + tuple(measures)
+    stats.Add(i, measures)
+
+    if verbose and stats.n[i] == repeats:
+      print 'p = %.2e: ' % ps[i] + ', '.join(
+        '%s = %.4g +/- %.2g' % (m, stats.mean[i, j], np.sqrt(stats.Variance()[i, j]))
+        for (j, m) in enumerate(MEASURES))
+
+  summary = np.zeros(len(ps), dtype=SUMMARY_DTYPE)
+  summary['p'] = ps
+  summary['n'] = stats.n
+  for (j, m) in enumerate(MEASURES):
+    summary[m + '_mean'] = stats.mean[:, j]
+    summary[m + '_var'] = stats.Variance()[:, j]
+
+  if output is not None:
+    np.savez(output, trials=trials, summary=summary)
+
+  return (trials, summary)
+
+
+class RunningStats(object):
+  """
+  Mean and variance of several vectors of measures for each of a number of
+  groups, updated one sample at a time with Welford's algorithm, so no
+  sample has to be kept.
+  """
+
+  def __init__(self, groups, size):
+    """
+    Inputs:
+    groups -- Number of groups
+    size   -- Number of measures in a sample
+    """
+
+    self.n    = np.zeros(groups, dtype=int)
+    self.mean = np.zeros([groups, size])
+    self.m2   = np.zeros([groups, size])
+
+  def Add(self, group, x):
+    """
+    Add the sample x, a vector of measures, to the given group.
+    """
+
+    self.n[group] += 1
+    delta = np.asarray(x) - self.mean[group]
+    self.mean[group] += delta / self.n[group]
+    self.m2[group] += delta * (x - self.mean[group])
+
+  def Variance(self):
+    """
+    Returns the sample variance of each measure of each group, or nan for
+    groups with less than two samples.
+    """
+
+    n = self.n[:, None].astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      return np.where(n > 1, self.m2 / (n - 1), np.nan)
+
+
+def _Trial(task):
+  """
+  Builds one network of a sweep and returns its task number, probability
+  number and measures.
+  """
+
+  (n, i, p, seed, N, k, samples) = task
+
+  rn.seed(seed)
+  CIJ = NetworkWattsStrogatz(N, k, p, sparse=True)
+
+  return (n, i, SmallWorldMeasures(CIJ, samples, seed=seed))
+
+
+def _ParallelMap(function, items, processes=None):
+  """
+  Yields function(item) for every item, in the order the results arrive
+  from a pool of processes. On Ctrl+C the pool is stopped.
+  """
+
+  if processes == 1:
+    for result in imap(function, items):
+      yield result
+    return
+
+  pool = mp.Pool(processes, signal.signal, (signal.SIGINT, signal.SIG_IGN))
+
+  try:
+    results = pool.imap_unordered(function, items)
+    for _ in xrange(len(items)):
+      yield results.next(2**31)
+  finally:
+    pool.terminate()
+    pool.join()
+
+
+if __name__ == '__main__':
+  import matplotlib.pyplot as plt
+
+  N = 1000
+  k = 10
+  ps = np.logspace(-4, 0, 50)
+  repeats = 100
+
+  (trials, summary) = SmallWorldSweep(N, k, ps, repeats, output='SmallWorldSweep.npz')
+
+  # Measures relative to the ring lattice, as in Watts and Strogatz (1998)
+  (CC0, PL0, SWI0) = SmallWorldMeasures(NetworkRingLattice(N, k, sparse=True))
+
+  plt.figure(1)
+  plt.semilogx(ps, summary['CC_mean']/CC0, 'o', label='C(p)/C(0)')
+  plt.semilogx(ps, summary['PL_mean']/PL0, 's', label='L(p)/L(0)')
+  plt.xlabel('Rewiring probability p')
+  plt.legend()
+
+  plt.figure(2)
+  plt.errorbar(ps, summary['SWI_mean'], yerr=np.sqrt(summary['SWI_var']), fmt='o')
+  plt.xscale('log')
+  plt.xlabel('Rewiring probability p')
+  plt.ylabel('Small-world index')
+  plt.show()
+
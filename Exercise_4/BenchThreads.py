@@ -0,0 +1,83 @@
+from IzNetwork import *
+
+import scipy.sparse as sp
+import multiprocessing as mp
+import time
+
+N = 50000          # Number of neurons
+SYNAPSES = 100     # Incoming synapses per neuron
+DMAX = 20
+T = 200            # Simulation time in ms
+THREADS = [1, 2, 4, 8, 16]
+SEED = 0
+
+def build_net(backend, threads):
+  """
+  Return one large layer of randomly connected excitatory neurons with
+  sparse S and delay matrices and a random input current per neuron.
+  """
+  rng = np.random.RandomState(SEED)
+
+  net = IzNetwork([N], DMAX, 'sparse', backend, threads)
+
+  r = rng.rand(N)
+  net.layer[0].N = N
+  net.layer[0].a = 0.02 * np.ones(N)
+  net.layer[0].b = 0.2 * np.ones(N)
+  net.layer[0].c = -65 + 15 * r**2
+  net.layer[0].d = 8 - 6 * r**2
+
+  rows = np.repeat(np.arange(N), SYNAPSES)
+  cols = rng.randint(N, size=N * SYNAPSES)
+  net.layer[0].S[0] = sp.csr_matrix((rng.rand(N * SYNAPSES), (rows, cols)), shape=(N, N))
+  net.layer[0].delay[0] = sp.csr_matrix((rng.randint(1, DMAX, size=N * SYNAPSES), (rows, cols)), shape=(N, N))
+  net.layer[0].factor[0] = 1
+
+  net.layer[0].v = -65 * np.ones(N)
+  net.layer[0].u = net.layer[0].b * net.layer[0].v
+
+  return net
+
+def run(backend, threads):
+  net = build_net(backend, threads)
+  rng = np.random.RandomState(SEED + 1)
+
+  # The first update compiles the connectivity and, for numba, the kernels.
+  net.layer[0].I = 5 * rng.randn(N)
+  net.Update(0)
+
+  start = time.time()
+  for t in xrange(1, T):
+    net.layer[0].I = 5 * rng.randn(N)
+    net.Update(t)
+  elapsed = time.time() - start
+
+  net.Close()
+
+  return (net.Firings(), elapsed)
+
+def main():
+  print '%d cores' % mp.cpu_count()
+
+  # Threads need the numba backend, the numpy one is the single-threaded
+  # baseline.
+  (firings, elapsed) = run('numpy', 1)
+  print 'numpy, %d neurons, %d spikes in %d ms: %.2f ms per step' % \
+    (N, len(firings), T, 1000 * elapsed / T)
+
+  (reference, serial) = run('numba', 1)
+  print 'numba, %d neurons, %d spikes in %d ms' % (N, len(reference), T)
+
+  for threads in THREADS:
+    (firings, elapsed) = run('numba', threads) if threads > 1 else (reference, serial)
+
+    assert np.array_equal(firings, reference), \
+      '%d threads give different spikes' % threads
+
+    # Efficiency is the speedup per thread, 1 for perfect scaling.
+    print '  %2d threads: %6.2f ms per step, %.2fx speedup, %3.0f%% efficiency' % \
+      (threads, 1000 * elapsed / T, serial / elapsed, 100 * serial / elapsed / threads)
+
+if __name__ == '__main__':
+  main()
+
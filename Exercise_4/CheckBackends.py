@@ -0,0 +1,33 @@
+from ModNetwork import *
+
+import time
+
+T = 5000  # Simulation time
+P = 0.2
+SEED = 0
+
+def main():
+  firings = {}
+
+  for backend in ['numpy', 'numba']:
+    mn = ModNetwork(P, seed=SEED, backend=backend)
+
+    # The first update compiles the connectivity and, for numba, the kernel.
+    mn.update_with_poisson(0.01, 0)
+
+    start = time.time()
+    for t in xrange(1, T):
+      mn.update_with_poisson(0.01, t)
+    elapsed = time.time() - start
+
+    firings[backend] = mn.net.Firings()
+
+    print '%s: %d spikes, %.2f s for %d ms (%.1fx real time)' % \
+      (backend, len(firings[backend]), elapsed, T, T / 1000.0 / elapsed)
+
+  assert np.array_equal(firings['numpy'], firings['numba']), 'backends give different spikes'
+  print 'Both backends give the same spikes.'
+
+if __name__ == '__main__':
+  main()
+
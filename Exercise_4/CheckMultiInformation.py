@@ -0,0 +1,109 @@
+from MultiInformation import multi_information, NOISE
+
+import numpy as np
+import numpy.random as rn
+
+import os
+import sys
+
+RESULTS_DIR = 'results/'
+SERIES_FILE = RESULTS_DIR + 'series_'
+REFERENCE_FILE = RESULTS_DIR + 'jidt_multiinformation.npy'
+JIDT_JAR = '../infodynamics.jar'
+
+# JIDT's noise is not seeded, so the reference is the mean of several runs.
+REFERENCE_RUNS = 20
+
+# Largest accepted difference to JIDT in nats. The noise that breaks ties
+# changes the estimates by up to about 0.005 nats (one standard deviation).
+TOLERANCE = 0.02
+
+def main():
+  check_gaussian()
+
+  if '--generate' in sys.argv:
+    generate_reference()
+
+  check_reference()
+
+def check_gaussian():
+  """
+  Compare the estimate for correlated Gaussian variables with the exact
+  multi-information -log(det(C)) / 2.
+  """
+
+  C = np.array([[1.0, 0.6, 0.3], [0.6, 1.0, 0.5], [0.3, 0.5, 1.0]])
+  x = rn.RandomState(0).multivariate_normal(np.zeros(3), C, 4000)
+
+  exact = -0.5 * np.log(np.linalg.det(C))
+  estimate = multi_information(x)
+
+  print 'Gaussian: %.4f nats estimated, %.4f nats exact' % (estimate, exact)
+  assert abs(estimate - exact) < 0.05, 'estimate too far from the exact value'
+
+def generate_reference():
+  """
+  Save the mean of REFERENCE_RUNS results of JIDT's
+  MultiInfoCalculatorKraskov2 for every saved time series. Needs Java, jpype
+  and infodynamics.jar.
+  """
+
+  from jpype import startJVM, shutdownJVM, getDefaultJVMPath, JPackage, JArray, JDouble
+
+  startJVM(getDefaultJVMPath(), '-Djava.class.path=' + JIDT_JAR)
+  calc = JPackage('infodynamics.measures.continuous.kraskov').MultiInfoCalculatorKraskov2()
+
+  results = []
+  for observations in load_observations():
+    runs = []
+    for run in range(REFERENCE_RUNS):
+      calc.setProperty('NORMALISE', 'true')
+      calc.setProperty('k', '4')
+      calc.setProperty('NOISE_LEVEL_TO_ADD', str(NOISE))
+      calc.initialise(observations.shape[1])
+
+      calc.setObservations(JArray(JDouble, 2)(observations.tolist()))
+      runs.append(calc.computeAverageLocalOfObservations())
+
+    results.append(np.mean(runs))
+
+  shutdownJVM()
+
+  np.save(REFERENCE_FILE, np.array(results))
+  print 'Saved JIDT results of %d time series to %s' % (len(results), REFERENCE_FILE)
+
+def check_reference():
+  if not os.path.isfile(REFERENCE_FILE):
+    print 'No JIDT results in %s. Run with --generate where Java and jpype' % REFERENCE_FILE
+    print 'are installed to save them.'
+    sys.exit(1)
+
+  reference = np.load(REFERENCE_FILE)
+  results = np.array([multi_information(observations) for observations in load_observations()])
+
+  assert len(results) > 0, 'no time series in %s' % RESULTS_DIR
+
+  assert len(results) == len(reference), 'the time series have changed since the JIDT results were saved'
+
+  error = np.abs(results - reference)
+  print 'JIDT: %d time series, largest difference %.2g nats' % (len(results), error.max())
+  assert error.max() < TOLERANCE, 'results differ from JIDT'
+
+def load_observations():
+  """
+  Return the observations of the time series saved as text files in
+  RESULTS_DIR, which do not change when Q2.py reruns its trials.
+  """
+
+  i = 0
+  observations = []
+  while os.path.isfile(SERIES_FILE + str(i) + '.txt'):
+    series = np.loadtxt(SERIES_FILE + str(i) + '.txt')
+    observations.append(np.asarray(np.transpose(series)))
+    i += 1
+
+  return observations
+
+if __name__ == '__main__':
+  main()
+
@@ -0,0 +1,57 @@
+from ModNetwork import *
+
+T = 2500  # Simulation time, across blocks of the drive
+P = 0.2
+SEED = 0
+RATE = 0.01
+
+def main():
+  check_regenerate()
+  check_default_time()
+
+def check_regenerate():
+  """
+  Check that a new drive gives the same input for any millisecond, in any
+  order, as one that went through all milliseconds before it.
+  """
+
+  for sparse in [True, False]:
+    drive = PoissonDrive([200, 800], RATE, [1, 2], EXTRA_I, 1000, sparse)
+    inputs = np.zeros([T, 1000])
+    for t in xrange(T):
+      drive.set_input(t, inputs[t])
+
+    fresh = PoissonDrive([200, 800], RATE, [1, 2], EXTRA_I, 1000, sparse)
+    I = np.zeros(1000)
+    for t in [2400, 7, 1999, 1000, 0]:
+      fresh.set_input(t, I)
+      assert np.array_equal(I, inputs[t]), 'input of millisecond %d differs' % t
+
+  print 'Regenerated input is the same.'
+
+def check_default_time():
+  """
+  Check that set_poisson_input without t gives the input of the next
+  millisecond of the network, so a network driven without times fires like
+  one driven with them.
+  """
+
+  firings = []
+  for timed in [True, False]:
+    mn = ModNetwork(P, seed=SEED)
+    mn.use_poisson_drive(RATE)
+
+    for t in xrange(T):
+      if timed:
+        mn.update_with_poisson(RATE, t)
+      else:
+        mn.set_poisson_input(RATE)
+        mn.net.Update()
+
+    firings.append(mn.net.Firings())
+
+  assert np.array_equal(firings[0], firings[1]), 'input without t differs'
+  print 'Input without t is that of the next millisecond: %d spikes.' % len(firings[0])
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,78 @@
+from ModNetwork import *
+
+import time
+
+T = 2000  # Simulation time
+P_VALUES = [0, 0.2, 0.5]
+SEED = 0
+WINDOW = 5  # Largest spike time difference, in ms, that counts as a match
+
+def main():
+  print 'Spike timing of single against double precision, %d ms' % T
+
+  for p in P_VALUES:
+    firings = {}
+    elapsed = {}
+    for precision in ['double', 'single']:
+      (firings[precision], elapsed[precision]) = run(p, precision)
+
+    (reference, compact) = (firings['double'], firings['single'])
+    (matched, drift) = timing_drift(reference, compact)
+
+    print 'p = %.1f' % p
+    print '  spikes:          %d double, %d single (%+.2f%%)' % \
+      (len(reference), len(compact), 100.0 * (len(compact) - len(reference)) / len(reference))
+    print '  identical until: %s' % first_difference(reference, compact)
+    print '  matched spikes:  %.1f%% within %d ms, mean drift %.2f ms' % \
+      (100 * matched, WINDOW, drift)
+    print '  time:            %.2f s double, %.2f s single' % \
+      (elapsed['double'], elapsed['single'])
+
+def run(p, precision):
+  mn = ModNetwork(p, seed=SEED, precision=precision)
+
+  start = time.time()
+  for t in xrange(T):
+    mn.update_with_poisson(0.01, t)
+
+  return (mn.net.Firings(), time.time() - start)
+
+def first_difference(reference, firings):
+  """
+  Return the first millisecond in which the two rasters differ, or 'end'.
+  """
+
+  n = min(len(reference), len(firings))
+  differ = np.where(np.any(reference[:n] != firings[:n], axis=1))[0]
+
+  if len(differ) > 0:
+    return '%d ms' % min(reference[differ[0], 0], firings[differ[0], 0])
+  if len(reference) != len(firings):
+    return '%d ms' % (reference[n:] if len(reference) > n else firings[n:])[0, 0]
+  return 'end'
+
+def timing_drift(reference, firings):
+  """
+  Return the fraction of reference spikes with a spike of the same neuron
+  within WINDOW ms in firings, and the mean time difference of those.
+  """
+
+  # Spikes of different neurons are always further apart than WINDOW
+  span = T + WINDOW + 1
+  key = np.sort(firings[:, 1] * span + firings[:, 0])
+  ref_key = reference[:, 1] * span + reference[:, 0]
+
+  if len(key) == 0:
+    return (0.0, np.nan)
+
+  i = np.searchsorted(key, ref_key)
+  before = key[np.maximum(i - 1, 0)]
+  after = key[np.minimum(i, len(key) - 1)]
+  distance = np.minimum(np.abs(ref_key - before), np.abs(after - ref_key))
+
+  matched = distance <= WINDOW
+  return (matched.mean(), distance[matched].mean())
+
+if __name__ == '__main__':
+  main()
+
@@ -1,12 +1,31 @@
 import numpy as np
 
+import copy
+import os
+from multiprocessing.pool import ThreadPool
+
+# The numba backend is optional
+try:
+  import numba
+except ImportError:
+  numba = None
+
+HAVE_NUMBA = numba is not None
+
+# Number types of each precision profile: (state and weights, delays)
+PRECISION = {
+  'double': (np.float64, np.int64),
+  'single': (np.float32, np.uint8),
+}
+
 
 class IzNetwork:
   """
   Network of Izhikevich neurons.
   """
 
-  def __init__(self, _neuronsPerLayer, _Dmax):
+  def __init__(self, _neuronsPerLayer, _Dmax, _engine='dense', _backend='numpy',
+               _threads=1, _precision='double'):
     """
     Initialise network with given number of neurons
 
@@ -15,110 +34,1124 @@ class IzNetwork:
                         [N1, N2, ... Nk] will return a network with k layers
                         with the corresponding number of neurons in each.
 
-    _Dmax            -- Maximum delay in all the synapses in the network. Any
-                        longer delay will result in failing to deliver spikes.
+    _Dmax            -- Maximum delay in all the synapses in the network. Only
+                        delays from 1 to Dmax-1 deliver spikes; any longer
+                        delay will result in failing to deliver spikes.
+
+    _engine          -- How spikes are delivered. 'dense' reads the layer[i].S,
+                        delay and factor matrices directly. 'sparse' compiles
+                        them into a single SynapseTable on the first update,
+                        so the cost of a spike depends on its number of
+                        synapses. Both give the same spike trains.
+
+    _backend         -- How neurons are integrated. 'numpy' is the reference
+                        implementation. 'numba' runs a compiled loop that
+                        integrates, detects spikes and resets in one pass
+                        without temporary arrays, and needs numba. Both give
+                        the same spike trains.
+
+    _threads         -- Number of threads. With more than one, the neurons are
+                        split into that many contiguous chunks, each thread
+                        integrates one chunk and delivers the spikes onto it,
+                        always adding them in the same order. Needs the
+                        sparse engine and the numba backend, whose kernels
+                        release the GIL; with numpy, every thread would loop
+                        over all spikes holding the GIL. The spike trains
+                        are the same for any number of threads. Call Close to
+                        stop the threads when the network is no longer used.
+
+    _precision       -- 'double' stores the state of the neurons, their input
+                        and the compiled weights as float64. 'single' stores
+                        them as float32 and the compiled delays as uint8,
+                        which halves the memory the updates go through but
+                        changes the spike trains slightly (see
+                        CheckPrecision.py). Only double precision gives the
+                        same spike trains for both backends.
     """
 
+    assert _engine in ('dense', 'sparse'), 'unknown engine %s' % _engine
+    assert _backend in ('numpy', 'numba'), 'unknown backend %s' % _backend
+    assert _threads == 1 or _engine == 'sparse', 'threads need the sparse engine'
+    assert _threads == 1 or _backend == 'numba', 'threads need the numba backend'
+    assert _precision in PRECISION, 'unknown precision %s' % _precision
+
+    if _backend == 'numba' and not HAVE_NUMBA:
+      raise ImportError('the numba backend needs numba to be installed')
+
     self.Dmax = _Dmax
     self.Nlayers = len(_neuronsPerLayer)
+    self.engine = _engine
+    self.backend = _backend
+
+    self.precision = _precision
+    (self.dtype, self.delay_dtype) = PRECISION[_precision]
+    assert _Dmax <= np.iinfo(self.delay_dtype).max + 1, 'Dmax too large for %s precision' % _precision
+
+    # Layers are stored one after another in a global neuron index, and
+    # their input queues are views into a queue for the whole network.
+    self.offset = np.concatenate([[0], np.cumsum(_neuronsPerLayer)])
+    self.queue  = DelayQueue(self.offset[-1], _Dmax, self.dtype)
 
     self.layer = {}
 
     for i, n in enumerate(_neuronsPerLayer):
-      self.layer[i] = IzLayer(n)
+      self.layer[i] = self.NewLayer(n)
+
+    # The state and parameters of all neurons are stored in contiguous
+    # vectors, and each layer's variables (v, u, a, b, c, d and I for
+    # Izhikevich neurons) are views into them.
+    self.variables = self.NewLayer(0).variables
+
+    N = self.offset[-1]
+    for name in self.variables:
+      setattr(self, name, np.zeros(N, dtype=self.dtype))
+
+    for i in xrange(self.Nlayers):
+      self.layer[i].queue = self.queue.View(self.offset[i], self.offset[i+1])
+      for name in self.variables:
+        self.layer[i].state[name] = getattr(self, name)[self.offset[i]:self.offset[i+1]]
+
+    # Compiled connectivity of the sparse engine. See Compile.
+    self.synapses = None
+
+    # Chunks of neurons [start, stop) handled by each thread
+    self.threads = _threads
+    self.pool    = ThreadPool(_threads) if _threads > 1 else None
+    bounds       = np.linspace(0, N, _threads + 1).astype(int)
+    self.chunks  = zip(bounds[:-1], bounds[1:])
+
+    # Number of milliseconds simulated so far. Synaptic delays are counted
+    # with it, so the t passed to Update only labels the recorded spikes.
+    self.steps = 0
+
+    # Objects such as a RateMonitor whose Record(t, fired) is called after
+    # every update with the global indices of the neurons that fired.
+    self.monitors = []
+
+    # Whether the layers keep their spikes in memory. Long runs can turn it
+    # off and write the spikes to a SpikeLog monitor instead.
+    self.record = True
+
+    # Number of milliseconds of spikes the layers have to keep, or None to
+    # keep all of them. Older spikes are dropped whenever a layer needs room
+    # for new ones, so the memory of a closed-loop run stays bounded. Needs
+    # increasing times t, such as the default of Update.
+    self.history = None
+
+    # Time of the last update
+    self.time = None
 
-  def Update(self, t):
+  def Update(self, t=None):
     """
     Run simulation of the whole network for 1 millisecond and update the
     network's internal variables.
 
     Inputs:
-    t -- Current timestep. Necessary to sort out the synaptic delays.
+    t -- Current timestep. Used as the time of the recorded spikes. Defaults
+         to the network's clock, the number of milliseconds simulated so far.
+    """
+    if t is None:
+      t = self.steps
+
+    if self.engine == 'sparse' and self.synapses is None:
+      self.Compile()
+
+    # Euler method step size in ms
+    dt = 0.2
+
+    # Add the synaptic current that arrives at this millisecond
+    self.I += self.queue.Pop(self.steps)
+
+    # Update all layers at once
+    fired = self.Integrate(dt)
+
+    # Record the spikes layer by layer and queue the current they will
+    # deliver to their targets. A stable sort by layer keeps the spikes of
+    # each layer in the order they were fired.
+    layer = np.searchsorted(self.offset, fired, side='right') - 1
+    order = np.argsort(layer, kind='mergesort')
+    fired, layer = fired[order], layer[order]
+
+    bounds = np.searchsorted(layer, np.arange(self.Nlayers + 1))
+    for j in np.unique(layer):
+      spikes = fired[bounds[j]:bounds[j+1]] - self.offset[j]
+
+      if self.record:
+        self.layer[j].recorder.Record(t, spikes, self.history)
+
+      if self.engine == 'dense':
+        self.ScatterSpikes(j, spikes)
+
+    # The sparse engine delivers the spikes of all layers in one go, in the
+    # same order.
+    if self.engine == 'sparse':
+      self.synapses.Scatter(self.queue, self.steps, fired, self.backend, self.pool)
+
+    for monitor in self.monitors:
+      monitor.Record(t, fired)
+
+    self.steps += 1
+    self.time = t
+
+  def NewLayer(self, n):
+    """
+    Return an empty layer of n neurons of the network's neuron model.
+    """
+    return IzLayer(n, self.Dmax)
+
+  def Kernel(self):
+    """
+    Return the Euler kernel of the network's neuron model and backend and
+    the list of vectors it takes.
+    """
+
+    if self.backend == 'numba':
+      euler = _IzEulerNumba
+    else:
+      euler = _IzEulerNumpy
+
+    return (euler, [self.v, self.u, self.a, self.b, self.c, self.d, self.I])
+
+  def Integrate(self, dt):
+    """
+    Update all neurons for 1 millisecond using the Euler method, and reset
+    the neurons that fire.
+
+    Inputs:
+    dt -- Euler method step size in ms
+
+    Outputs:
+    fired -- Global indices of the neurons that fired, Euler step by step
+    """
+
+    (euler, vectors) = self.Kernel()
+    steps = int(1/dt)
+
+    if self.pool is None:
+      return euler(*(vectors + [dt, steps]))[0]
+
+    # Each thread integrates its own chunk of neurons
+    def Run(chunk):
+      (start, stop) = chunk
+      return euler(*([x[start:stop] for x in vectors] + [dt, steps]))
+
+    results = self.pool.map(Run, self.chunks)
+
+    # Put the spikes of all chunks back in the order of a single kernel
+    fired = []
+    for k in xrange(steps):
+      for ((start, stop), (spikes, counts)) in zip(self.chunks, results):
+        first = counts[:k].sum()
+        fired.append(start + spikes[first:first + counts[k]])
+
+    return np.concatenate(fired)
+
+  def Close(self):
+    """
+    Stop the threads of the network, if any. The network can still be
+    updated afterwards, in a single thread.
+    """
+
+    if self.pool is not None:
+      self.pool.close()
+      self.pool.join()
+      self.pool = None
+
+  def Firings(self):
+    """
+    Return the spikes of all layers as an (n, 2) array of [t, neuron] rows
+    sorted by time, where neurons are numbered with the global index.
+    """
+
+    firings = [self.layer[i].firings + [0, self.offset[i]] for i in xrange(self.Nlayers)]
+    firings = np.concatenate(firings)
+
+    return firings[np.argsort(firings[:, 0], kind='mergesort')]
+
+  def RecentFirings(self, i, window):
+    """
+    Return the spikes of layer i during the last window milliseconds, up to
+    and including the last update, as an (n, 2) array of [t, neuron index]
+    rows. Times are relative to the start of the window, from 0 to
+    window-1. Needs increasing times t (see history).
+    """
+
+    if self.time is None:
+      return np.zeros([0, 2], dtype=int)
+
+    start = self.time - window + 1
+    return self.layer[i].recorder.Since(start) - [start, 0]
+
+  def SaveState(self, directory):
+    """
+    Save everything that changes during a simulation as .npy files in the
+    given directory: the vectors of all neurons, the input waiting in the
+    delay queue, the number of steps, the time of the last update, the
+    recorded spikes and the state of the monitors that have one. The
+    connectivity is not saved.
+
+    Inputs:
+    directory -- Directory to save to, created if needed
     """
-    for lr in xrange(self.Nlayers):
-      self.NeuronUpdate(lr, t)
 
-  def NeuronUpdate(self, i, t):
+    if not os.path.exists(directory):
+      os.makedirs(directory)
+
+    def Save(name, value):
+      np.save(os.path.join(directory, name + '.npy'), value)
+
+    for name in self.variables:
+      Save(name, getattr(self, name))
+
+    Save('queue', self.queue.buffer)
+    Save('steps', np.array(self.steps))
+    if self.time is not None:
+      Save('time', np.array(self.time))
+
+    # Spikes of each layer in the order they were recorded, layer by layer
+    Save('firings', np.concatenate([self.layer[i].firings + [0, self.offset[i]]
+                                    for i in xrange(self.Nlayers)]))
+
+    for (k, monitor) in enumerate(self.monitors):
+      if hasattr(monitor, 'GetState'):
+        for (name, value) in monitor.GetState().items():
+          Save('monitor%d_%s' % (k, name), value)
+
+  def LoadState(self, directory):
     """
-    Izhikevich neuron update function. Update one layer for 1 millisecond
-    using the Euler method.
+    Continue from a state saved by SaveState into a network with the same
+    layers, connectivity and monitors. The files are read as memory maps,
+    so only the data is read, once. Updating the network afterwards gives
+    exactly the same spikes as the network that was saved.
 
     Inputs:
-    i -- Number of layer to update
-    t -- Current timestep. Necessary to sort out the synaptic delays.
+    directory -- Directory saved by SaveState
     """
 
-    # Euler method step size in ms
-    dt = 0.2
+    def Load(name):
+      return np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
 
-    # Calculate current from incoming spikes
-    for j in xrange(self.Nlayers):
+    for name in self.variables:
+      getattr(self, name)[...] = Load(name)
 
-      # If layer[i].S[j] exists then layer[i].factor[j] and
-      # layer[i].delay[j] have to exist
-      if j in self.layer[i].S:
-        S = self.layer[i].S[j]  # target neuron->rows, source neuron->columns
+    self.queue.buffer[...] = Load('queue')
+    self.steps = int(Load('steps'))
+    self.time = None
+    if os.path.isfile(os.path.join(directory, 'time.npy')):
+      self.time = int(Load('time'))
 
-        # Firings contains time and neuron idx of each spike.
-        # [t, index of the neuron in the layer j]
-        firings = self.layer[j].firings
+    firings = np.array(Load('firings')).reshape(-1, 2)
+    layer = np.searchsorted(self.offset, firings[:, 1], side='right') - 1
+    for i in xrange(self.Nlayers):
+      self.layer[i].firings = firings[layer == i] - [0, self.offset[i]]
 
-        # Find incoming spikes taking delays into account
-        delay = self.layer[i].delay[j]
+    for (k, monitor) in enumerate(self.monitors):
+      if hasattr(monitor, 'GetState'):
+        names = monitor.GetState().keys()
+        monitor.SetState(dict((name, Load('monitor%d_%s' % (k, name))) for name in names))
+
+  def Connectivity(self, kind='S', sparse=False, downsample=1):
+    """
+    Return the connectivity of the whole network as one matrix with a row
+    per target and a column per source neuron, numbered with the global
+    index, assembled from the S, delay and factor blocks of the layers.
+    Entries without a synapse are 0.
+
+    Inputs:
+    kind       -- 'S' for the weights, 'weight' for the weights times the
+                  layer factor, 'delay' or 'factor'
+    sparse     -- Return a scipy.sparse CSR matrix instead of an array
+    downsample -- Average the matrix over squares of downsample x downsample
+                  neurons, e.g. to display a large network. Delays are
+                  averaged over the synapses in each square only.
+    """
+
+    assert kind in ('S', 'weight', 'delay', 'factor'), 'unknown kind %s' % kind
+
+    N = self.offset[-1]
+    n = -(-N // downsample)
+
+    rows = []
+    cols = []
+    values = []
+
+    for (target, source, w, d, F) in self.SynapseBlocks():
+      if kind == 'weight':
+        w = F * w
+      elif kind == 'delay':
+        w = d
+      elif kind == 'factor':
+        w = F * np.ones(len(target))
+
+      rows.append(target)
+      cols.append(source)
+      values.append(w)
+
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=int)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=int)
+    values = np.concatenate(values) if values else np.zeros(0)
+
+    if downsample > 1:
+      (rows, cols) = (rows // downsample, cols // downsample)
+
+      if kind == 'delay':
+        # Absent synapses have no delay, so delays are averaged over the
+        # synapses in each square only.
+        (cells, index) = np.unique(rows * n + cols, return_inverse=True)
+        values = np.bincount(index, values) / np.bincount(index)
+        (rows, cols) = (cells // n, cells % n)
+      else:
+        values = values / float(downsample**2)
+
+    if sparse:
+      import scipy.sparse
+      return scipy.sparse.coo_matrix((values, (rows, cols)), shape=(n, n)).tocsr()
+
+    # Several entries can fall into one square of a downsampled matrix
+    if downsample > 1:
+      return np.bincount(rows * n + cols, values, minlength=n * n).reshape(n, n)
+
+    matrix = np.zeros([n, n], dtype=values.dtype)
+    matrix[rows, cols] = values
+    return matrix
+
+  def SynapseBlocks(self):
+    """
+    Yield the synapses of each S matrix of the layers as (target, source, S,
+    delay, factor): the global indices of the target and source neurons, the
+    weight and the delay of every nonzero entry of S, and the layer factor of
+    the block.
+    """
+
+    for i in xrange(self.Nlayers):
+      for j in self.layer[i].S:
+        S = self.layer[i].S[j]
+        D = self.layer[i].delay[j]
         F = self.layer[i].factor[j]
 
-        # Sum current from incoming spikes
-        k = len(firings)
-        while k > 0 and (firings[k-1, 0] > (t - self.Dmax)):
-          idx = delay[:, firings[k-1, 1]] == (t-firings[k-1, 0])
-          self.layer[i].I[idx] = self.layer[i].I[idx] + F * S[idx, firings[k-1, 1]]
-          k = k-1
+        # S and delay can also be scipy.sparse matrices
+        if hasattr(S, 'tocoo'):
+          S = S.tocoo()
+          (rows, cols, w) = (S.row, S.col, S.data)
+        else:
+          (rows, cols) = np.nonzero(S)
+          w = S[rows, cols]
+
+        d = np.asarray(D[rows, cols]).ravel()
+
+        yield (self.offset[i] + rows, self.offset[self.Source(i, j)] + cols, w, d, F)
+
+  def Source(self, i, j):
+    """
+    Return the global number of the layer that layer[i].S[j] comes from.
+    """
+    return j
+
+  def Compile(self):
+    """
+    Compile the connectivity matrices of all layers into the SynapseTable
+    used by the sparse engine. Update calls this on its first step; call it
+    again after changing any S, delay or factor.
+    """
+
+    self.synapses = SynapseTable(self)
 
-    # Update v and u using the Izhikevich model and Euler method
-    for k in xrange(int(1/dt)):
-      v = self.layer[i].v
-      u = self.layer[i].u
+    # With threads, the table is split by target so that every thread only
+    # writes to the queue of its own chunk of neurons.
+    if self.pool is not None:
+      self.synapses.parts = [self.synapses.Subset(start, stop) for (start, stop) in self.chunks]
 
-      self.layer[i].v += dt*(0.04*v*v + 5*v + 140 - u + self.layer[i].I)
-      self.layer[i].u += dt*(self.layer[i].a*(self.layer[i].b*v - u))
+  def ScatterSpikes(self, j, fired):
+    """
+    Add the current that the spikes of layer j will deliver to the input
+    queues of their target layers, in the slot of the millisecond in which
+    each of them arrives. Delays must be between 1 and Dmax-1. This is the
+    dense engine; the sparse one uses SynapseTable.Scatter.
 
-      # Find index of neurons that have fired this millisecond
-      fired = np.where(self.layer[i].v >= 30)[0]
+    Inputs:
+    j     -- Number of the layer the spikes come from
+    fired -- Array with the indices of the neurons that fired
+    """
+
+    for i in xrange(self.Nlayers):
+      if j in self.layer[i].S:
+        S      = self.layer[i].S[j]
+        delay  = self.layer[i].delay[j]
+        F      = self.layer[i].factor[j]
+        buffer = self.layer[i].queue.buffer
 
-      if len(fired) > 0:
         for f in fired:
-          # Add spikes into spike train
-          if len(self.layer[i].firings) != 0:
-            self.layer[i].firings = np.vstack([self.layer[i].firings, [t, f]])
-          else:
-            self.layer[i].firings = np.array([[t, f]])
+          d = delay[:, f].astype(int)
+          idx = np.where((d > 0) & (d < self.Dmax))[0]
+          buffer[(self.steps + d[idx]) % self.Dmax, idx] += F * S[idx, f]
+
+
+class IzEnsemble(IzNetwork):
+  """
+  Several independent IzNetworks with the same Dmax, backend and precision,
+  simulated as a single network. The layers of all members are stacked one
+  after another, so one Update advances every member in the same vectorised
+  step, and their connectivity is compiled into one block-diagonal
+  SynapseTable.
+
+  The members' layers become layers of the ensemble and their vectors become
+  views into the ensemble's, so reading or setting net.layer[k] or writing
+  into net.I of a member keeps working, but members must not be updated on
+  their own any more. Each member gives exactly the same spike trains as
+  if it had been simulated alone.
+  """
+
+  def __init__(self, networks, threads=1):
+    """
+    Inputs:
+    networks -- List of IzNetworks to simulate together
+    threads  -- Number of threads, see IzNetwork
+    """
+
+    Dmax = networks[0].Dmax
+    assert all(net.Dmax == Dmax for net in networks), 'Dmax must be the same'
+
+    precision = networks[0].precision
+    assert all(net.precision == precision for net in networks), 'precision must be the same'
+
+    sizes = [net.layer[k].N for net in networks for k in xrange(net.Nlayers)]
+    IzNetwork.__init__(self, sizes, Dmax, 'sparse', networks[0].backend, threads, precision)
+
+    self.members = networks
+
+    # First ensemble layer of the member each ensemble layer belongs to
+    self.base = []
+
+    i = 0
+    for net in networks:
+      base = i
+      for k in xrange(net.Nlayers):
+        layer = net.layer[k]
 
-          # Reset the membrane potential after spikes
-          self.layer[i].v[f]  = self.layer[i].c[f]
-          self.layer[i].u[f] += self.layer[i].d[f]
+        # Move the member's state and pending input into the ensemble
+        for name in self.variables:
+          self.layer[i].state[name][...] = layer.state[name]
+          layer.state[name] = self.layer[i].state[name]
+        self.layer[i].queue.buffer[...] = layer.queue.buffer
+        layer.queue = self.layer[i].queue
 
-    return
+        self.layer[i] = layer
+        self.base.append(base)
+        i += 1
 
+      # The member's own vectors become views of its part of the ensemble
+      start, stop = self.offset[base], self.offset[i]
+      for name in self.variables:
+        setattr(net, name, getattr(self, name)[start:stop])
+      net.queue = self.queue.View(start, stop)
 
-class IzLayer:
+  def Source(self, i, j):
+    """
+    Return the global number of the layer that layer[i].S[j] comes from.
+    Connectivity keys refer to layers of the same member.
+    """
+    return self.base[i] + j
+
+
+def _IzEulerNumpy(v, u, a, b, c, d, I, dt, steps):
+  """
+  Reference Izhikevich kernel. Run the given number of Euler steps on the
+  vectors v and u in place and return the indices of the neurons that fired
+  in each step, one step after another, and the number of spikes per step.
+  """
+
+  fired = []
+  for k in xrange(steps):
+    v += dt*(0.04*v*v + 5*v + 140 - u + I)
+    u += dt*(a*(b*v - u))
+
+    # Find index of neurons that have fired this millisecond
+    fired.append(np.where(v >= 30)[0])
+
+    # Reset the membrane potential after spikes
+    v[fired[k]]  = c[fired[k]]
+    u[fired[k]] += d[fired[k]]
+
+  return (np.concatenate(fired), np.array([len(f) for f in fired]))
+
+
+if HAVE_NUMBA:
+
+  @numba.njit(cache=True, nogil=True)
+  def _IzEulerNumba(v, u, a, b, c, d, I, dt, steps):
+    """
+    Compiled version of _IzEulerNumpy. Each neuron is integrated, checked and
+    reset in the same pass with the same floating point operations, so the
+    results are identical.
+    """
+
+    fired = np.empty(steps * len(v), dtype=np.int64)
+    counts = np.zeros(steps, dtype=np.int64)
+    n = 0
+
+    for k in range(steps):
+      for i in range(len(v)):
+        vi = v[i]
+        v[i] = vi + dt*(0.04*vi*vi + 5*vi + 140 - u[i] + I[i])
+        u[i] = u[i] + dt*(a[i]*(b[i]*v[i] - u[i]))
+
+        if v[i] >= 30:
+          fired[n] = i
+          n += 1
+          counts[k] += 1
+
+          v[i] = c[i]
+          u[i] = u[i] + d[i]
+
+    return (fired[:n], counts)
+
+  @numba.njit(cache=True, nogil=True)
+  def _ScatterNumba(buffer, step, fired, indptr, target, weight, delay):
+    """
+    Compiled version of the loop in SynapseTable.Scatter, adding the same
+    values in the same order.
+    """
+
+    Dmax = buffer.shape[0]
+
+    for f in fired:
+      for s in range(indptr[f], indptr[f+1]):
+        buffer[(step + delay[s]) % Dmax, target[s]] += weight[s]
+
+
+def StateVariable(name):
+  """
+  Property for a per-neuron variable of a layer. Assigning to it copies the
+  value into the layer's storage, which for a layer of an IzNetwork is a
+  view into the network's vector, instead of rebinding the attribute.
+  """
+
+  def get(self):
+    return self.state[name]
+
+  def set(self, value):
+    self.state[name][...] = value
+
+  return property(get, set)
+
+
+class IzLayer(object):
   """
   Layer of Izhikevich neurons to be used inside an IzNetwork.
   """
 
-  def __init__(self, n):
+  variables = ['v', 'u', 'a', 'b', 'c', 'd', 'I']
+
+  v = StateVariable('v')
+  u = StateVariable('u')
+  a = StateVariable('a')
+  b = StateVariable('b')
+  c = StateVariable('c')
+  d = StateVariable('d')
+  I = StateVariable('I')
+
+  def __init__(self, n, Dmax=1):
     """
     Initialise layer with empty vectors.
 
     Inputs:
-    n -- Number of neurons in the layer
+    n    -- Number of neurons in the layer
+    Dmax -- Maximum synaptic delay of the network the layer belongs to
     """
 
     self.N = n
-    self.a = np.zeros(n)
-    self.b = np.zeros(n)
-    self.c = np.zeros(n)
-    self.d = np.zeros(n)
+    self.state = dict((name, np.zeros(n)) for name in self.variables)
 
     self.S      = {}
     self.delay  = {}
     self.factor = {}
+
+    self.queue    = DelayQueue(n, Dmax)
+    self.recorder = SpikeRecorder()
+
+  @property
+  def firings(self):
+    """
+    Spike train of the layer as an (n, 2) array of [t, neuron index] rows.
+    """
+    return self.recorder.Firings()
+
+  @firings.setter
+  def firings(self, value):
+    self.recorder.Reset(value)
+
+
+class SpikeRecorder(object):
+  """
+  Spike train of one layer. Spikes are appended to a buffer that doubles its
+  capacity when full, so recording n spikes costs O(n) copies overall. With
+  a history, the spikes that are too old are dropped first, so the buffer
+  only grows with the number of spikes in the history.
+  """
+
+  def __init__(self, capacity=1024):
+    """
+    Inputs:
+    capacity -- Initial number of spikes the buffer can hold
+    """
+
+    self.data = np.zeros([capacity, 2], dtype=int)
+    self.n    = 0
+
+  def Record(self, t, fired, history=None):
+    """
+    Append the spikes of neurons fired at time t.
+
+    Inputs:
+    t       -- Time of the spikes in milliseconds
+    fired   -- Array with the indices of the neurons that fired
+    history -- If given, spikes older than history milliseconds before t
+               may be dropped to make room
+    """
+
+    m = len(fired)
+    full = self.n + m > len(self.data)
+
+    if full and history is not None:
+      kept = self.Since(t - history + 1)
+      self.n = len(kept)
+      self.data[:self.n] = kept
+
+      # Still grow if the kept spikes fill half of the buffer, so that they
+      # are not moved again after a few updates
+      full = self.n + m > len(self.data) // 2
+
+    if full:
+      grown = np.zeros([max(2*len(self.data), self.n + m), 2], dtype=int)
+      grown[:self.n] = self.data[:self.n]
+      self.data = grown
+
+    self.data[self.n:self.n+m, 0] = t
+    self.data[self.n:self.n+m, 1] = fired
+    self.n += m
+
+  def Firings(self):
+    """
+    Return all recorded spikes as an (n, 2) array of [t, neuron index] rows.
+    """
+    return self.data[:self.n]
+
+  def Since(self, start):
+    """
+    Return the recorded spikes from time start on, assuming they were
+    recorded in order of time.
+    """
+
+    first = np.searchsorted(self.data[:self.n, 0], start)
+    return self.data[first:self.n]
+
+  def Reset(self, firings):
+    """
+    Replace the recorded spikes with the given (n, 2) array of [t, neuron
+    index] rows. An empty array clears the recorder.
+    """
+
+    firings = np.asarray(firings, dtype=int).reshape(-1, 2)
+
+    self.data = np.zeros([max(1024, len(firings)), 2], dtype=int)
+    self.data[:len(firings)] = firings
+    self.n    = len(firings)
+
+
+class RateMonitor(object):
+  """
+  Mean number of spikes per millisecond of groups of neurons over sliding
+  windows, computed while the network runs. Only the cumulative spike
+  counts of the last milliseconds are kept, so its memory does not depend
+  on the length of the run, apart from the means it has produced.
+
+  The monitor must be added to the monitors of a network, which records
+  one millisecond per update. Windows start hop milliseconds apart from
+  the first millisecond counted.
+  """
+
+  def __init__(self, group, windows, hop, start=0):
+    """
+    Inputs:
+    group   -- Array with the group of each neuron of the network, numbered
+               from 0, or -1 for neurons that are not counted
+    windows -- List of window lengths in milliseconds
+    hop     -- Milliseconds between the starts of two windows
+    start   -- Number of milliseconds to ignore at the start of the run
+    """
+
+    group = np.asarray(group)
+
+    self.G       = group.max() + 1
+    self.group   = np.where(group < 0, self.G, group)
+    self.windows = list(windows)
+    self.hop     = hop
+    self.start   = start
+
+    # Spikes of each group counted since the start, for the last
+    # max(windows) + 1 milliseconds, in a circular buffer
+    self.cumulative = np.zeros([max(self.windows) + 1, self.G], dtype=np.int64)
+    self.n = 0
+
+    self.means = dict((w, []) for w in self.windows)
+
+  def Record(self, t, fired):
+    """
+    Count the spikes of one millisecond and store the means of the windows
+    that end with it.
+
+    Inputs:
+    t     -- Time of the spikes in milliseconds
+    fired -- Array with the global indices of the neurons that fired
+    """
+
+    k = self.n - self.start
+    self.n += 1
+
+    if k < 0:
+      return
+
+    W = len(self.cumulative)
+    counts = np.bincount(self.group[fired], minlength=self.G + 1)[:self.G]
+    self.cumulative[(k + 1) % W] = self.cumulative[k % W] + counts
+
+    for w in self.windows:
+      first = k + 1 - w
+      if first >= 0 and first % self.hop == 0:
+        self.means[w].append((self.cumulative[(k + 1) % W] - self.cumulative[first % W]) / float(w))
+
+  def GetState(self):
+    """
+    Return the state of the monitor as a dictionary of arrays.
+    """
+
+    state = {'cumulative': self.cumulative, 'n': np.array(self.n)}
+    for w in self.windows:
+      state['means%d' % w] = self.Series(w).T
+
+    return state
+
+  def SetState(self, state):
+    """
+    Continue from a state returned by GetState.
+    """
+
+    self.cumulative[...] = state['cumulative']
+    self.n = int(state['n'])
+    for w in self.windows:
+      self.means[w] = list(np.array(state['means%d' % w]))
+
+  def Series(self, window):
+    """
+    Return the means of the given window length as a (groups, windows)
+    array with one time series per group.
+    """
+
+    if len(self.means[window]) == 0:
+      return np.zeros([self.G, 0])
+
+    return np.array(self.means[window]).T
+
+
+class SpikeLog(object):
+  """
+  Monitor that writes the spikes of a network to an append-only log on
+  disk, so that recording a run of any length needs a fixed amount of
+  memory. The log is a directory with three files:
+
+    spikes.bin -- int32 [t, neuron] rows, neurons with the global index
+    index.bin  -- int64 [first t, last t, first row, rows] of each chunk
+    offset.npy -- First global index of each layer
+
+  Spikes are buffered and written a chunk at a time, the rows before their
+  index entry, so the log only ever contains whole chunks. The times passed
+  to Record must not decrease. Opening an existing log appends to it, and
+  SpikeLogReader reads it.
+  """
+
+  def __init__(self, directory, offset, chunk=65536):
+    """
+    Inputs:
+    directory -- Directory of the log, created if needed
+    offset    -- Offsets of the layers of the network (IzNetwork.offset)
+    chunk     -- Number of spikes per chunk
+    """
+
+    if not os.path.exists(directory):
+      os.makedirs(directory)
+
+    self.directory = directory
+    np.save(os.path.join(directory, 'offset.npy'), offset)
+
+    self.buffer = np.zeros([chunk, 2], dtype=np.int32)
+    self.n      = 0
+
+    # Continue after the last whole chunk of an existing log
+    index = _ReadIndex(directory)
+    self.rows = int(index[-1, 2] + index[-1, 3]) if len(index) else 0
+    self._Truncate(self.rows, len(index))
+
+  def Record(self, t, fired):
+    """
+    Buffer the spikes of neurons fired at time t and write every chunk that
+    is full.
+
+    Inputs:
+    t     -- Time of the spikes in milliseconds
+    fired -- Array with the global indices of the neurons that fired
+    """
+
+    while len(fired) > 0:
+      m = min(len(fired), len(self.buffer) - self.n)
+      self.buffer[self.n:self.n+m, 0] = t
+      self.buffer[self.n:self.n+m, 1] = fired[:m]
+      self.n += m
+      fired = fired[m:]
+
+      if self.n == len(self.buffer):
+        self.Flush()
+
+  def Flush(self):
+    """
+    Write the buffered spikes to the log as a chunk.
+    """
+
+    if self.n == 0:
+      return
+
+    chunk = self.buffer[:self.n]
+    with open(os.path.join(self.directory, 'spikes.bin'), 'ab') as f:
+      chunk.tofile(f)
+    with open(os.path.join(self.directory, 'index.bin'), 'ab') as f:
+      np.array([chunk[0, 0], chunk[-1, 0], self.rows, self.n], dtype=np.int64).tofile(f)
+
+    self.rows += self.n
+    self.n = 0
+
+  def Close(self):
+    """
+    Write the spikes that are still buffered.
+    """
+    self.Flush()
+
+  def GetState(self):
+    """
+    Write the buffered spikes and return the length of the log, so that a
+    network restored with IzNetwork.LoadState continues the log from there.
+    """
+
+    self.Flush()
+    return {'rows': np.array(self.rows)}
+
+  def SetState(self, state):
+    """
+    Drop the spikes logged after the state returned by GetState.
+    """
+
+    rows = int(state['rows'])
+    index = _ReadIndex(self.directory)
+    chunks = np.searchsorted(index[:, 2] + index[:, 3], rows, side='right')
+
+    self.n = 0
+    self.rows = rows
+    self._Truncate(rows, chunks)
+
+  def _Truncate(self, rows, chunks):
+    # Cut off rows and index entries that are not part of the log, e.g.
+    # written after the last index entry when a run was interrupted.
+    for (name, size) in [('spikes.bin', rows * 2 * 4), ('index.bin', chunks * 4 * 8)]:
+      with open(os.path.join(self.directory, name), 'ab') as f:
+        f.truncate(size)
+
+
+class SpikeLogReader(object):
+  """
+  Read access to a SpikeLog, also while it is being written. The spikes are
+  memory-mapped and the chunk index limits the rows read to those of the
+  requested times.
+  """
+
+  def __init__(self, directory):
+    self.directory = directory
+    self.offset = np.load(os.path.join(directory, 'offset.npy'))
+
+  def Spikes(self, start=None, stop=None, layer=None):
+    """
+    Return the logged spikes from time start to stop-1 as an (n, 2) array of
+    [t, neuron] rows, in the order they were recorded.
+
+    Inputs:
+    start -- First time, or None to start with the first spike
+    stop  -- Time after the last one, or None to end with the last spike
+    layer -- Only return spikes of this layer, numbered within the layer as
+             in IzLayer.firings. With None, neurons have the global index.
+    """
+
+    index = _ReadIndex(self.directory)
+    if len(index) == 0:
+      return np.zeros([0, 2], dtype=np.int32)
+
+    # Chunks are in time order, so the chunks with spikes from start to
+    # stop-1 are consecutive.
+    first = 0 if start is None else np.searchsorted(index[:, 1], start, side='left')
+    last = len(index) if stop is None else np.searchsorted(index[:, 0], stop, side='left')
+    if first >= last:
+      return np.zeros([0, 2], dtype=np.int32)
+
+    rows = index[last-1, 2] + index[last-1, 3]
+    spikes = np.memmap(os.path.join(self.directory, 'spikes.bin'), dtype=np.int32,
+                       mode='r', shape=(rows, 2))
+    spikes = spikes[index[first, 2]:rows]
+
+    t = spikes[:, 0]
+    lo = 0 if start is None else np.searchsorted(t, start, side='left')
+    hi = len(t) if stop is None else np.searchsorted(t, stop, side='left')
+    spikes = np.array(spikes[lo:hi])
+
+    if layer is not None:
+      (begin, end) = (self.offset[layer], self.offset[layer+1])
+      spikes = spikes[(spikes[:, 1] >= begin) & (spikes[:, 1] < end)] - [0, begin]
+
+    return spikes
+
+
+def _ReadIndex(directory):
+  """
+  Return the chunk index of a SpikeLog as an (n, 4) array.
+  """
+
+  path = os.path.join(directory, 'index.bin')
+  if not os.path.isfile(path):
+    return np.zeros([0, 4], dtype=np.int64)
+
+  index = np.fromfile(path, dtype=np.int64)
+  return index[:len(index) // 4 * 4].reshape(-1, 4)
+
+
+class DelayQueue(object):
+  """
+  Synaptic input of one layer for the next Dmax milliseconds, stored as a
+  circular buffer with one slot per millisecond. Spikes add their current to
+  the slot of the millisecond they arrive in when they are fired, so each
+  update only has to read and clear a single slot.
+  """
+
+  def __init__(self, n, Dmax, dtype=np.float64):
+    """
+    Inputs:
+    n     -- Number of neurons in the layer
+    Dmax  -- Number of slots, one per millisecond of delay
+    dtype -- Number type of the input
+    """
+
+    self.buffer = np.zeros([Dmax, n], dtype=dtype)
+
+  def View(self, start, stop):
+    """
+    Return a queue for neurons start to stop-1 that shares this buffer.
+    """
+
+    view = DelayQueue(0, len(self.buffer))
+    view.buffer = self.buffer[:, start:stop]
+    return view
+
+  def Pop(self, step):
+    """
+    Return the input that arrives at the given simulation step and clear its
+    slot so that it can be reused Dmax milliseconds later.
+    """
+
+    slot = step % len(self.buffer)
+    current = self.buffer[slot].copy()
+    self.buffer[slot] = 0
+    return current
+
+
+class SynapseTable(object):
+  """
+  Synapses of a whole network in compressed sparse row (CSR) form. Neurons
+  are numbered with the network's global index and the synapses of each
+  source neuron are stored contiguously, sorted by target, with the weight
+  already multiplied by the layer factor. Synapses with zero weight or a
+  delay outside [1, Dmax) never deliver anything and are left out.
+  """
+
+  def __init__(self, net):
+    """
+    Build the table from the S, delay and factor matrices of a network.
+
+    Inputs:
+    net -- IzNetwork to compile
+    """
+
+    self.Dmax = net.Dmax
+
+    source = []
+    target = []
+    weight = []
+    delay  = []
+
+    for (post, pre, w, d, F) in net.SynapseBlocks():
+      d = d.astype(int)
+      keep = (w != 0) & (d > 0) & (d < net.Dmax)
+
+      source.append(pre[keep])
+      target.append(post[keep])
+      weight.append(F * w[keep])
+      delay.append(d[keep])
+
+    N = net.offset[-1]
+    source = np.concatenate(source) if source else np.zeros(0, dtype=int)
+    target = np.concatenate(target) if target else np.zeros(0, dtype=int)
+
+    order = np.argsort(source * N + target)
+
+    self.target = target[order]
+    self.weight = (np.concatenate(weight)[order] if weight else np.zeros(0)).astype(net.dtype)
+    self.delay  = (np.concatenate(delay)[order] if delay else np.zeros(0)).astype(net.delay_dtype)
+    self.indptr = np.concatenate([[0], np.cumsum(np.bincount(source, minlength=N))])
+
+    # Tables with the synapses onto each thread's chunk of neurons
+    self.parts = None
+
+  def Subset(self, start, stop):
+    """
+    Return a table with only the synapses onto neurons start to stop-1.
+    """
+
+    source = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+    keep = (self.target >= start) & (self.target < stop)
+
+    table = copy.copy(self)
+    table.target = self.target[keep]
+    table.weight = self.weight[keep]
+    table.delay  = self.delay[keep]
+    table.indptr = np.concatenate([[0], np.cumsum(np.bincount(source[keep], minlength=len(self.indptr) - 1))])
+
+    return table
+
+  def Scatter(self, queue, step, fired, backend='numpy', pool=None):
+    """
+    Add the current of the given spikes to the queue of the whole network.
+    Whatever the backend and number of threads, the current arriving at
+    each neuron is added in the order of fired.
+
+    Inputs:
+    queue   -- DelayQueue of the whole network
+    step    -- Simulation step at which the spikes were fired
+    fired   -- Array with the global indices of the neurons that fired
+    backend -- 'numpy' or 'numba'
+    pool    -- ThreadPool to scatter with the tables in parts, if any
+    """
+
+    if pool is not None and self.parts is not None:
+      pool.map(lambda table: table.Scatter(queue, step, fired, backend), self.parts)
+      return
+
+    if backend == 'numba':
+      _ScatterNumba(queue.buffer, step, fired, self.indptr, self.target, self.weight, self.delay)
+      return
+
+    for f in fired:
+      s, e = self.indptr[f], self.indptr[f+1]
+      queue.buffer[(step + self.delay[s:e].astype(int)) % self.Dmax, self.target[s:e]] += self.weight[s:e]
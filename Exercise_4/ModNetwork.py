@@ -1,14 +1,18 @@
 import numpy as np
 import numpy.random as rn
+import scipy.sparse as sp
 
-from IzNetwork import IzNetwork
+from IzNetwork import IzNetwork, IzEnsemble, RateMonitor
+from Sweep import save_atomic_directory
+from PoissonDrive import PoissonDrive
+
+import os
 
 # Network constants from the slides.
 EXCIT_MODULES = 8
 EXCIT_NEURONS_PER_MODULE = 100
 
 INHIB_NEURONS = 200
-INHIB_INPUTS = 4
 
 CONNECTIONS_PER_MODULE = 1000
 
@@ -17,112 +21,282 @@ DMAX = 15
 EXTRA_I = 15 # Current to cause spontaneous firing
  
 class ModNetwork:
-
-  def __init__(self, p):
+  """
+  Modular network of excitatory modules and one layer of inhibitory neurons,
+  built with rewiring probability p. The sizes default to the network from
+  the slides; larger networks should use sparse_blocks, which stores the
+  connections between excitatory neurons and from excitatory to inhibitory
+  neurons as scipy.sparse matrices (sparse engine only) and leaves out
+  the blocks without any connection. precision is the precision profile of
+  the IzNetwork, which also sets the number types of S and delay.
+  """
+
+  def __init__(self, p, engine='sparse', seed=None, backend='numpy',
+               modules=EXCIT_MODULES, neurons_per_module=EXCIT_NEURONS_PER_MODULE,
+               inhib_neurons=INHIB_NEURONS, connections_per_module=CONNECTIONS_PER_MODULE,
+               sparse_blocks=False, precision='double'):
     assert 0 <= p <= 1
+    assert not sparse_blocks or engine == 'sparse', 'sparse blocks need the sparse engine'
 
-    self.net = self._build_net(p)
+    # Every excitatory neuron drives exactly one inhibitory neuron, and each
+    # inhibitory neuron listens to a group of neurons from a single module.
+    excit_neurons = modules * neurons_per_module
+    assert excit_neurons % inhib_neurons == 0, 'inhibitory neurons must divide excitatory neurons'
+    assert neurons_per_module % (excit_neurons / inhib_neurons) == 0, \
+      'inhibitory inputs must divide the neurons per module'
 
-  def update_with_poisson(self, l, t):
-    self.net.layer[0].I = rn.poisson(l, INHIB_NEURONS) * EXTRA_I 
+    self.modules = modules
+    self.neurons_per_module = neurons_per_module
+    self.inhib_neurons = inhib_neurons
+    self.inhib_inputs = excit_neurons / inhib_neurons
+    self.connections_per_module = connections_per_module
+    self.sparse_blocks = sparse_blocks
+
+    # Every network draws from its own random stream, so a network built
+    # with a given seed is reproducible whatever else is being simulated.
+    self.p = p
+    self.seed = seed
+    self.rng = rn.RandomState(seed)
+
+    self.net = self._build_net(p, engine, backend, precision)
 
-    for i in range(1, EXCIT_MODULES + 1):
-      self.net.layer[i].I = rn.poisson(l, EXCIT_NEURONS_PER_MODULE) * EXTRA_I 
-    
+    # Pregenerated Poisson input, see use_poisson_drive
+    self.drive = None
+
+  def update_with_poisson(self, l, t):
+    self.set_poisson_input(l, t)
     self.net.Update(t)
 
-  def _build_net(self, p):
-    neurons_per_layer = [INHIB_NEURONS] + [EXCIT_NEURONS_PER_MODULE] * EXCIT_MODULES
+  def set_poisson_input(self, l, t=None):
+    """
+    Set the Poisson input of rate l of millisecond t, by default the next
+    millisecond the network simulates.
+    """
+
+    if self.drive is not None:
+      assert l == self.drive.rate, 'the Poisson drive has another rate'
+      self.drive.set_input(self.net.steps if t is None else t, self.net.I)
+      return
+
+    # The layers are contiguous in the network's input vector, inhibitory
+    # neurons first, so one draw covers all of them.
+    self.net.I[:] = self.rng.poisson(l, self.net.I.size) * EXTRA_I
+
+  def use_poisson_drive(self, l, block=1000, sparse=True):
+    """
+    Take the Poisson input of rate l of update_with_poisson from a
+    PoissonDrive, generated block milliseconds at a time, instead of
+    drawing it every millisecond. Each layer gets its own seed from the
+    network's random stream.
+    """
+
+    sizes = [self.net.layer[i].N for i in range(self.net.Nlayers)]
+    seeds = self.rng.randint(2**31, size=len(sizes))
+
+    self.drive = PoissonDrive(sizes, l, seeds, EXTRA_I, block, sparse)
+
+  def save_checkpoint(self, directory):
+    """
+    Save the state of the simulation (see IzNetwork.SaveState) and of the
+    random stream to directory, replacing the last checkpoint only once the
+    new one is complete.
+    """
+    save_atomic_directory(directory, self._save_checkpoint)
+
+  def _save_checkpoint(self, directory):
+    self.net.SaveState(directory)
+    _save_rng(self.rng, directory, 'rng')
+
+  def load_checkpoint(self, directory):
+    """
+    Continue from a checkpoint of a ModNetwork built with the same arguments
+    and return the number of milliseconds simulated so far.
+    """
+    self.net.LoadState(directory)
+    _load_rng(self.rng, directory, 'rng')
+    return self.net.steps
+
+  def module_groups(self):
+    """
+    Return the excitatory module of each neuron, or -1 for inhibitory
+    neurons.
+    """
+    n = self.neurons_per_module
+    return np.concatenate([-np.ones(self.inhib_neurons, dtype=int), np.arange(self.modules * n) / n])
+
+  def add_rate_monitor(self, windows, hop, start=0):
+    """
+    Attach a RateMonitor of the mean firing rate of each excitatory module
+    to the network and return it.
+    """
+    monitor = RateMonitor(self.module_groups(), windows, hop, start)
+    self.net.monitors.append(monitor)
+    return monitor
+
+  def _build_net(self, p, engine, backend, precision):
+    neurons_per_layer = [self.inhib_neurons] + [self.neurons_per_module] * self.modules
 
     # Create a net where the first layer contains all inhibitory neurons, the
     # remaining layers each contain a module of excitatory neurons.
-    net = IzNetwork(neurons_per_layer, DMAX)
+    net = IzNetwork(neurons_per_layer, DMAX, engine, backend, _precision=precision)
 
     # Turn the first layer into inhibtory neurons.
     self._to_inhibitory_layer(net.layer[0])
 
     # Turn the remaining layers into excitatory neurons.
-    for i in range(EXCIT_MODULES):
+    for i in range(self.modules):
       self._to_excitatory_layer(net.layer[i + 1])
 
     # Set the v, u and firing values for each layer.
     for i in range(len(neurons_per_layer)):
       self._init_layer(net.layer[i])
 
-    # Connect inhib -> everything
+    # Connect inhib -> everything, without inhib self connections.
     for i in range(len(neurons_per_layer)):
       toSize = neurons_per_layer[i]
-      net.layer[i].S[0] = rn.uniform(-1, 0, size=(toSize, INHIB_NEURONS))
+      net.layer[i].S[0] = self.rng.uniform(-1, 0, size=(toSize, self.inhib_neurons)).astype(net.dtype)
+      net.layer[i].delay[0] = np.ones([toSize, self.inhib_neurons], dtype=net.delay_dtype)
 
-    # Remove inhib self connections.
-    for i in range(INHIB_NEURONS):
-      net.layer[0].S[0][i][i] = 0
+    np.fill_diagonal(net.layer[0].S[0], 0)
 
-    # Initialise all excit -> inhib connections to 0
-    for excitLayer in range(1, EXCIT_MODULES + 1):
-      net.layer[0].S[excitLayer] = np.zeros([INHIB_NEURONS, EXCIT_NEURONS_PER_MODULE])
-
-    # Connect 4 random excit -> inhib
+    # Connect random excit -> inhib
     self._connect_excit_to_inhib(net)
 
-    # Connect excit -> excit in modules
-    rewire_set = {}
-    for i in range(EXCIT_MODULES):
-      (connections, connection_set) = self._create_random_connections(EXCIT_NEURONS_PER_MODULE, CONNECTIONS_PER_MODULE)
-      
-      for j in range(EXCIT_MODULES):
-      	net.layer[i + 1].S[j + 1] = connections if j == i else np.zeros([EXCIT_NEURONS_PER_MODULE, EXCIT_NEURONS_PER_MODULE])
-
-      rewire_set[i + 1] = connection_set
+    # Connect excit -> excit in modules, then rewire excit -> excit. Edges
+    # are numbered globally over all excitatory neurons from here on.
+    (start, end) = self._create_random_connections()
+    end = self._rewire_net(p, start, end)
 
-    # Rewire excit -> excit
-    self._rewire_net(net, p, rewire_set)
+    delays = self.rng.randint(low=1, high=20, size=len(start)).astype(net.delay_dtype)
+    self._set_excit_blocks(net, start, end, delays)
 
     return net
 
   def _connect_excit_to_inhib(self, net):
-    # Create a random array which contains 25 indexes to each excit module.
-    excit_modules = np.arange(1, EXCIT_MODULES + 1)
-    duplicates = EXCIT_NEURONS_PER_MODULE / INHIB_INPUTS
-    layer_indexes = [excit_modules[i / duplicates] for i in range(EXCIT_MODULES * duplicates)]
-    rn.shuffle(layer_indexes)
-
-    # Create an array of unique indexes to each neuron for each excit module.
-    module_indexes = [rn.choice(EXCIT_NEURONS_PER_MODULE, \
-      EXCIT_NEURONS_PER_MODULE, replace=0).tolist() for i in range(EXCIT_MODULES)]
-
-    # Use layer_indexes to decide which excit layer the inhib neuron should
-    # connect to, then use module_indexes to find four excit neurons which
-    # haven't been connected to an inhib neuron yet.
-    for inhibNeuron in range(INHIB_NEURONS):
-      layer = layer_indexes.pop()
-      for _ in range(INHIB_INPUTS):
-        excitNeuron = module_indexes[layer - 1].pop()
-
-        assert net.layer[0].S[layer][inhibNeuron][excitNeuron] == 0
-        net.layer[0].S[layer][inhibNeuron][excitNeuron] = rn.rand()
-
-  def _rewire_net(self, net, p, rewire_set):
-    for layer in rewire_set:
-      for (start, end) in rewire_set[layer]:
-        if (rn.rand() < p):
-          assert net.layer[layer].S[layer][end][start] == 1
-
-          net.layer[layer].S[layer][end][start] = 0
-
-          toLayer = 1 + rn.randint(EXCIT_MODULES)
-          newEnd = rn.randint(EXCIT_NEURONS_PER_MODULE)
-          while net.layer[toLayer].S[layer][newEnd][start] == 1 \
-              or (layer == toLayer and newEnd == start):
-            toLayer = 1 + rn.randint(EXCIT_MODULES)
-            newEnd = rn.randint(EXCIT_NEURONS_PER_MODULE)
-
-          net.layer[toLayer].S[layer][newEnd][start] = 1
+    n = self.neurons_per_module
+    inputs = self.inhib_inputs
+
+    # Give each module the same number of inhib neurons, in random order.
+    layer_indexes = self.rng.permutation(np.repeat(np.arange(self.modules), n / inputs))
+
+    # Deal out a random permutation of the neurons of each module, inputs at
+    # a time, to the inhib neurons of that module, so no excit neuron is
+    # connected to an inhib neuron twice.
+    inhib = np.argsort(layer_indexes, kind='mergesort')
+    excit = np.argsort(self.rng.rand(self.modules, n), axis=1).reshape(-1, inputs)
+
+    inhib = np.repeat(inhib, inputs)
+    layers = np.repeat(layer_indexes[inhib[::inputs]], inputs)
+    excit = excit.ravel()
+    weights = self.rng.rand(len(excit)).astype(net.dtype)
+    ones = np.ones(len(excit), dtype=net.delay_dtype)
+
+    for m in range(self.modules):
+      here = layers == m
+      shape = (self.inhib_neurons, n)
+
+      if self.sparse_blocks:
+        net.layer[0].S[m + 1] = sp.csr_matrix((weights[here], (inhib[here], excit[here])), shape=shape)
+        net.layer[0].delay[m + 1] = sp.csr_matrix((ones[here], (inhib[here], excit[here])), shape=shape)
+      else:
+        net.layer[0].S[m + 1] = np.zeros(shape, dtype=net.dtype)
+        net.layer[0].S[m + 1][inhib[here], excit[here]] = weights[here]
+        net.layer[0].delay[m + 1] = np.ones(shape, dtype=net.delay_dtype)
+
+      net.layer[0].factor[m + 1] = 50
+
+  def _create_random_connections(self):
+    """
+    Return the start and end neurons of connections_per_module random
+    connections within each module, without self connections or repeated
+    connections, numbered globally over all excitatory neurons.
+    """
+
+    n = self.neurons_per_module
+
+    # Draw distinct numbers of connections between two different neurons of
+    # a module, and turn each number into the pair of neurons.
+    edges = np.array([self.rng.permutation(n * (n - 1))[:self.connections_per_module]
+                      for _ in range(self.modules)])
+
+    start = edges / (n - 1)
+    end = edges % (n - 1)
+    end += end >= start
+
+    offset = n * np.arange(self.modules)[:, None]
+
+    return ((start + offset).ravel(), (end + offset).ravel())
+
+  def _rewire_net(self, p, start, end):
+    """
+    Return the new ends of the connections after rewiring each one with
+    probability p to a random excitatory neuron it is not connected to yet.
+    The connections are rewired in bulk: all rewired ones are removed first,
+    and new ends that clash with a connection or with an earlier rewired
+    connection are drawn again until none is left.
+    """
+
+    N = self.modules * self.neurons_per_module
+    end = end.copy()
+
+    pending = np.where(self.rng.rand(len(start)) < p)[0]
+    taken = np.setdiff1d(start * N + end, start[pending] * N + end[pending])
+
+    while len(pending) > 0:
+      new_end = self.rng.randint(N, size=len(pending))
+      key = start[pending] * N + new_end
+
+      # Only the first of several rewired connections to the same pair is kept
+      first = np.zeros(len(pending), dtype=bool)
+      first[np.unique(key, return_index=True)[1]] = True
+
+      ok = first & (new_end != start[pending]) & ~np.in1d(key, taken)
+
+      end[pending[ok]] = new_end[ok]
+      taken = np.union1d(taken, key[ok])
+      pending = pending[~ok]
+
+    return end
+
+  def _set_excit_blocks(self, net, start, end, delays):
+    """
+    Split the excit -> excit connections into the S and delay blocks of the
+    excitatory layers.
+    """
+
+    n = self.neurons_per_module
+    ones = np.ones(len(start), dtype=net.dtype)
+
+    # Sort the connections by block, so that each block is one slice.
+    block = (end / n) * self.modules + start / n
+    order = np.argsort(block, kind='mergesort')
+    (block, start, end, delays) = (block[order], start[order], end[order], delays[order])
+    bounds = np.searchsorted(block, np.arange(self.modules**2 + 1))
+
+    for i in range(self.modules):
+      for j in range(self.modules):
+        here = slice(bounds[i * self.modules + j], bounds[i * self.modules + j + 1])
+        rows, cols = end[here] % n, start[here] % n
+
+        if self.sparse_blocks:
+          if len(rows) == 0:
+            continue
+
+          net.layer[i + 1].S[j + 1] = sp.csr_matrix((ones[here], (rows, cols)), shape=(n, n))
+          net.layer[i + 1].delay[j + 1] = sp.csr_matrix((delays[here], (rows, cols)), shape=(n, n))
+        else:
+          net.layer[i + 1].S[j + 1] = np.zeros([n, n], dtype=net.dtype)
+          net.layer[i + 1].S[j + 1][rows, cols] = 1
+
+          net.layer[i + 1].delay[j + 1] = np.zeros([n, n], dtype=net.delay_dtype)
+          net.layer[i + 1].delay[j + 1][rows, cols] = delays[here]
+
+        net.layer[i + 1].factor[j + 1] = 17
 
   def _to_inhibitory_layer(self, layer):
     n = layer.N
 
-    r = rn.rand(n)
+    r = self.rng.rand(n)
 
     # Use random values from: http://izhikevich.org/publications/net.m
     layer.a = 0.02 * np.ones(n) + 0.08 * r
@@ -131,49 +305,113 @@ class ModNetwork:
     layer.d = 2 * np.ones(n)
     layer.I = np.zeros(n)
 
-    layer.delay[0] = np.ones([INHIB_NEURONS, INHIB_NEURONS], dtype=int)
     layer.factor[0] = 1
 
-    for i in range(1, EXCIT_MODULES + 1):
-      layer.delay[i] = np.ones([INHIB_NEURONS, EXCIT_NEURONS_PER_MODULE])
-      layer.factor[i] = 50
-
   def _to_excitatory_layer(self, layer):
     n = layer.N
 
-    r = rn.rand(n)
+    r = self.rng.rand(n)
  
     layer.a = 0.02 * np.ones(n)
     layer.b = 0.20 * np.ones(n)
     layer.c = -65 + 15*(r**2)
     layer.d = 8 - 6*(r**2) 
 
-    layer.delay[0] = np.ones([EXCIT_NEURONS_PER_MODULE, INHIB_NEURONS])
     layer.factor[0] = 2 
 
-    for i in range(1, EXCIT_MODULES + 1):
-      layer.delay[i] = rn.randint(low=1, high=20, size=(EXCIT_NEURONS_PER_MODULE, EXCIT_NEURONS_PER_MODULE)) 
-      layer.factor[i] = 17 
-
   def _init_layer(self, layer):
     layer.v = -65 * np.ones(layer.N)
     layer.u = layer.b * layer.v
     layer.firings = np.array([])
 
-  def _create_random_connections(self, size, connections):
-    connection_matrix = np.zeros([size, size])
-    connection_set = []
 
-    for _ in range(connections):
-      start = rn.randint(size)
-      end = rn.randint(size)
-      while connection_matrix[end][start] == 1 or start == end:
-        start = rn.randint(size)
-        end = rn.randint(size)
+class ModEnsemble:
+  """
+  Batch of independent ModNetworks, e.g. one per rewiring probability,
+  simulated together in one IzEnsemble. Each member draws its connectivity
+  and input from its own seeded stream, and its spikes are the same as
+  those of ModNetwork(p, seed=seed) simulated alone.
+  """
+
+  def __init__(self, p_values, seeds, backend='numpy', precision='double'):
+    assert len(p_values) == len(seeds)
 
-      # Add this connection to the matrix and store in set.
-      connection_matrix[end][start] = 1
-      connection_set.append((start, end))
+    self.members = [ModNetwork(p, 'sparse', seed, backend, precision=precision)
+                    for (p, seed) in zip(p_values, seeds)]
+    self.net = IzEnsemble([mn.net for mn in self.members])
+
+  def update_with_poisson(self, l, t):
+    for mn in self.members:
+      mn.set_poisson_input(l, t)
+
+    self.net.Update(t)
 
-    return (connection_matrix, connection_set)
+  def use_poisson_drive(self, l, block=1000, sparse=True):
+    """
+    Give every member a PoissonDrive, see ModNetwork.use_poisson_drive.
+    """
+    for mn in self.members:
+      mn.use_poisson_drive(l, block, sparse)
+
+  def save_checkpoint(self, directory):
+    """
+    Save the state of the simulation and of the random stream of every
+    member, see ModNetwork.save_checkpoint.
+    """
+    save_atomic_directory(directory, self._save_checkpoint)
+
+  def _save_checkpoint(self, directory):
+    self.net.SaveState(directory)
+    np.save(os.path.join(directory, 'members.npy'), self._member_keys())
+    for (k, mn) in enumerate(self.members):
+      _save_rng(mn.rng, directory, 'rng%d' % k)
+
+  def load_checkpoint(self, directory):
+    """
+    Continue from a checkpoint of a ModEnsemble built with the same arguments
+    and return the number of milliseconds simulated so far. Raises
+    ValueError if the checkpoint is of other members.
+    """
+    members = np.load(os.path.join(directory, 'members.npy'))
+    if not np.array_equal(members, self._member_keys()):
+      raise ValueError('checkpoint %s is of other networks' % directory)
+
+    self.net.LoadState(directory)
+    for (k, mn) in enumerate(self.members):
+      _load_rng(mn.rng, directory, 'rng%d' % k)
+    return self.net.steps
+
+  def _member_keys(self):
+    # p and seed of each member, which identify its network and input
+    return np.array([(mn.p, mn.seed) for mn in self.members], dtype=float)
+
+  def add_rate_monitor(self, windows, hop, start=0):
+    """
+    Attach a RateMonitor of the mean firing rate of each excitatory module
+    of each member to the ensemble and return it. The modules of member k
+    are the groups k * modules to (k + 1) * modules - 1.
+    """
+
+    groups = []
+    first = 0
+    for mn in self.members:
+      group = mn.module_groups()
+      groups.append(np.where(group < 0, -1, group + first))
+      first += mn.modules
+
+    monitor = RateMonitor(np.concatenate(groups), windows, hop, start)
+    self.net.monitors.append(monitor)
+    return monitor
+
+
+def _save_rng(rng, directory, name):
+  # Mersenne Twister keys, then position and the cached Gaussian
+  (_, keys, pos, has_gauss, gauss) = rng.get_state()
+  np.save(os.path.join(directory, name + '_keys.npy'), keys)
+  np.save(os.path.join(directory, name + '.npy'), np.array([pos, has_gauss, gauss]))
+
+def _load_rng(rng, directory, name):
+  keys = np.load(os.path.join(directory, name + '_keys.npy'))
+  (pos, has_gauss, gauss) = np.load(os.path.join(directory, name + '.npy'))
+  rng.set_state(('MT19937', keys, int(pos), int(has_gauss), gauss))
 
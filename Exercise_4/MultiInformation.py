@@ -0,0 +1,93 @@
+import numpy as np
+import numpy.random as rn
+
+from scipy.spatial import cKDTree
+from scipy.special import digamma
+
+# Defaults of JIDT's MultiInfoCalculatorKraskov2 as used by Q2. JIDT's noise
+# is not seeded, so a fixed seed is used here instead.
+K = 4
+NORMALISE = True
+NOISE = 1e-8
+SEED = 0
+
+def multi_information(observations, k=K, normalise=NORMALISE, noise=NOISE, seed=SEED):
+  """
+  Return the multi-information in nats of the columns of observations with
+  the Kraskov-Stoegbauer-Grassberger estimator (algorithm 2), computed like
+  JIDT's MultiInfoCalculatorKraskov2:
+
+    I = psi(k) - (d-1)/k + (d-1) psi(N) - <sum_v psi(n_v)>
+
+  where the k nearest neighbours of each of the N observations are found
+  with the max norm over all d variables, and n_v counts the other
+  observations whose variable v is at most as far as the furthest of those
+  neighbours in v.
+
+  Inputs:
+  observations -- (N, d) array with one row per observation
+  k            -- Number of nearest neighbours
+  normalise    -- Scale each variable to mean 0 and standard deviation 1
+  noise        -- Standard deviation of Gaussian noise added to the
+                  (normalised) observations to break ties, like JIDT's
+                  NOISE_LEVEL_TO_ADD. Without it, repeated observations make
+                  the estimate depend on their order. 0 adds none.
+  seed         -- Seed of the noise
+  """
+
+  x = np.array(observations, dtype=float)
+  (N, d) = x.shape
+
+  if normalise:
+    x = (x - x.mean(axis=0)) / x.std(axis=0, ddof=1)
+
+  if noise > 0:
+    x += noise * rn.RandomState(seed).randn(N, d)
+
+  # The point itself is one of its k + 1 nearest neighbours, but with
+  # repeated observations not necessarily the first one.
+  (_, neighbours) = cKDTree(x).query(x, k + 1, p=np.inf)
+  others = neighbours != np.arange(N)[:, None]
+  order = np.argsort(~others, axis=1, kind='mergesort')
+  neighbours = np.take_along_axis(neighbours, order, axis=1)[:, :k]
+
+  # Largest distance to the neighbours in each variable
+  eps = np.abs(x[neighbours] - x[:, None, :]).max(axis=1)
+
+  n = np.array([_count_within(x[:, v], eps[:, v]) for v in range(d)]).T - 1
+
+  return digamma(k) - (d - 1.0) / k + (d - 1) * digamma(N) - digamma(n).sum(axis=1).mean()
+
+def _count_within(x, eps):
+  """
+  Return the number of values of x within eps[i] of each x[i], including
+  x[i] itself. Distances are computed as |x[j] - x[i]| exactly, so that
+  values at exactly eps are counted.
+  """
+
+  values = np.sort(x)
+
+  # The values within eps are a contiguous run of the sorted values, found
+  # with two vectorised binary searches.
+  first = _search(values, lambda v: x - v <= eps)
+  stop = _search(values, lambda v: v - x > eps)
+
+  return stop - first
+
+def _search(values, condition):
+  """
+  Return, for each element, the first index of the sorted values for which
+  condition, which must be false and then true along them, holds.
+  """
+
+  lo = np.zeros(len(values), dtype=int)
+  hi = np.full(len(values), len(values), dtype=int)
+
+  while np.any(lo < hi):
+    mid = (lo + hi) // 2
+    holds = condition(values[np.minimum(mid, len(values) - 1)]) & (lo < hi)
+    hi = np.where(holds, mid, hi)
+    lo = np.where(~holds & (lo < hi), mid + 1, lo)
+
+  return lo
+
@@ -0,0 +1,97 @@
+import numpy as np
+import numpy.random as rn
+
+
+class PoissonDrive:
+  """
+  Poisson input to the neurons of a network, generated for blocks of
+  milliseconds at a time instead of with one draw per millisecond. Each
+  neuron gets a Poisson number of input events with the given rate every
+  millisecond, times scale.
+
+  Block b of layer j is drawn from its own stream seeded with
+  (seeds[j], b), so the input of a layer only depends on its seed, and the
+  input of any millisecond can be generated again without any other state,
+  e.g. when resuming a simulation from a checkpoint.
+
+  A sparse drive stores the events of a block as (t, neuron, count) arrays,
+  which suits small rates. A dense drive stores a (block, neurons) array.
+  """
+
+  def __init__(self, sizes, rate, seeds, scale=1, block=1000, sparse=True):
+    """
+    Inputs:
+    sizes  -- List with the number of neurons of each layer
+    rate   -- Mean number of events per neuron and millisecond
+    seeds  -- List with the seed of each layer
+    scale  -- Input current of one event
+    block  -- Number of milliseconds generated at once
+    sparse -- Store the input of a block as events instead of dense arrays
+    """
+
+    assert len(sizes) == len(seeds)
+
+    self.offset = np.concatenate([[0], np.cumsum(sizes)])
+    self.rate   = rate
+    self.seeds  = list(seeds)
+    self.scale  = scale
+    self.block  = block
+    self.sparse = sparse
+
+    # Number of the block that is generated, if any
+    self.current = None
+
+  def set_input(self, t, I):
+    """
+    Write the input of millisecond t into the vector I of all neurons.
+    """
+
+    b = t // self.block
+    if b != self.current:
+      self._generate(b)
+
+    k = t - b * self.block
+
+    if self.sparse:
+      (start, stop) = (self.bounds[k], self.bounds[k + 1])
+      I[:] = 0
+      I[self.neurons[start:stop]] = self.inputs[start:stop]
+    else:
+      I[:] = self.inputs[k]
+
+  def _generate(self, b):
+    times = []
+    neurons = []
+    counts = []
+
+    if not self.sparse:
+      self.inputs = np.zeros([self.block, self.offset[-1]])
+
+    for (j, seed) in enumerate(self.seeds):
+      rng = rn.RandomState([seed, b])
+      (offset, n) = (self.offset[j], self.offset[j + 1] - self.offset[j])
+
+      if not self.sparse:
+        self.inputs[:, offset:offset + n] = rng.poisson(self.rate, (self.block, n)) * self.scale
+        continue
+
+      # The events of a block are a Poisson number of events spread
+      # uniformly over its milliseconds and neurons, which gives each neuron
+      # an independent Poisson count every millisecond.
+      events = rng.randint(self.block * n, size=rng.poisson(self.rate * self.block * n))
+      (cells, count) = np.unique(events, return_counts=True)
+
+      times.append(cells // n)
+      neurons.append(offset + cells % n)
+      counts.append(count)
+
+    if self.sparse:
+      times = np.concatenate(times)
+      order = np.argsort(times, kind='mergesort')
+
+      self.neurons = np.concatenate(neurons)[order]
+      self.inputs  = np.concatenate(counts)[order] * self.scale
+      self.bounds  = np.searchsorted(times[order], np.arange(self.block + 1))
+
+    self.current = b
+
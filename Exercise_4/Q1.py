@@ -1,92 +1,95 @@
 from ModNetwork import *
+from Sweep import parallel_map, save_atomic, trial_seeds
+from SpikeAnalysis import select_neurons, spike_counts, window_rates
 
 import matplotlib.pyplot as plt
 
+import os
+
 T  = 1000  # Simulation time
 PLOT_OUTPUT_DIR = 'plots/'
 
+P_VALUES = [0, 0.1, 0.2, 0.3, 0.4, 0.5]
+
+# Number of worker processes, None for one per core.
+PROCESSES = None
+
+# Seeds of the networks for each p, derived from SWEEP_SEED.
+SWEEP_SEED = 0
+SEEDS = trial_seeds(SWEEP_SEED, len(P_VALUES))
+
 def main():
-  p_values = [0, 0.1, 0.2, 0.3, 0.4, 0.5]
+  # Only simulate the networks whose plots are missing.
+  missing = [i for i in range(len(P_VALUES)) if not plots_exist(P_VALUES[i])]
+
+  # The networks are simulated in a pool of processes, and only this process
+  # plots the arrays they return.
+  results = parallel_map(run_trial, missing, PROCESSES)
 
-  for p in p_values:
-    print 'Simulating network with p =', p
+  for (i, (all_connections, firings, mean_firings_x, mean_firings_y)) in zip(missing, results):
+    p = P_VALUES[i]
 
-    mn = ModNetwork(p)
-    
-    # Bring all connections into one matrix to display.
-    all_connections = get_connection_matrix(mn.net)
-    
     # Plot the connectivity matrix.
     plot_connectivity_matrix(p, all_connections)
-    
-    # Simulate
-    run_net(mn)
-    
-    # Find the time and neuron ID of all firings.
-    (all_firings_x, all_firings_y) = get_firings(mn.net)
-    
-    # Find the mean firings for each module
-    np_firings_x = np.array(all_firings_x)
-    np_firings_y = np.array(all_firings_y)
-    (mean_firings_x, mean_firings_y) = get_mean_firings(np_firings_x, np_firings_y)
 
     # Plot firings and mean firings.
-    plot_firings(p, all_firings_x, all_firings_y, mean_firings_x, mean_firings_y)
+    plot_firings(p, firings[:, 0], firings[:, 1], mean_firings_x, mean_firings_y)
+
+def run_trial(i):
+  (p, seed) = (P_VALUES[i], SEEDS[i])
+  print 'Simulating network with p =', p
+
+  mn = ModNetwork(p, seed=seed)
+  mn.use_poisson_drive(0.01)
+
+  # Bring all connections into one matrix to display.
+  all_connections = get_connection_matrix(mn.net)
+
+  # Simulate
+  run_net(mn)
+
+  # Find the time and neuron ID of all firings.
+  firings = get_firings(mn.net)
+
+  # Find the mean firings for each module
+  (mean_firings_x, mean_firings_y) = get_mean_firings(firings)
+
+  return (all_connections, firings, mean_firings_x, mean_firings_y)
+
+def plots_exist(p):
+  return os.path.isfile(connectivity_plot_name(p)) and os.path.isfile(firings_plot_name(p))
+
+def connectivity_plot_name(p):
+  return '%sconnectivity_matrix_p=%.1f.eps' % (PLOT_OUTPUT_DIR, p)
+
+def firings_plot_name(p):
+  return '%sfirings_p=%.1f.eps' % (PLOT_OUTPUT_DIR, p)
 
 def run_net(mn):
   for t in xrange(T):  
      mn.update_with_poisson(0.01, t)
 
 def get_connection_matrix(net):
-  all_connections = []
-  for fromLayer in range(9):
-    for fromNeuron in range(net.layer[fromLayer].N):
-      row = []
-      for toLayer in range(9):
-        for toNeuron in range(net.layer[toLayer].N):
-          row.append(net.layer[toLayer].S[fromLayer][toNeuron][fromNeuron])
-      
-      all_connections.append(row)
-  return all_connections
+  # One row per neuron a connection comes from.
+  return net.Connectivity().T
 
 def get_firings(net):
-  all_firings_x = []
-  all_firings_y = []
-  
-  for layer in range(1, EXCIT_MODULES + 1):
-    idx = 100 * (layer - 1)
-    
-    for i in range(len(net.layer[layer].firings)):
-      firing = net.layer[layer].firings[i]
-      all_firings_x.append(firing[0])
-      all_firings_y.append(idx + firing[1])
-
-  return (all_firings_x, all_firings_y)
-
-def get_mean_firings(np_firings_x, np_firings_y):
-  mean_firings_x = {}
-  mean_firings_y = {}
-
-  for layer in range(EXCIT_MODULES):
-    mean_firings_x[layer] = []
-    mean_firings_y[layer] = []
-    for i in range(0, 49):
-      t = 20 * i
-      tMin = t - 25
-      tMax = t + 25
-  
-      inRange = (np_firings_x >= tMin) * (np_firings_x < tMax) * (np_firings_y >= 100 * layer) * (np_firings_y < 100 + 100 * layer)    
-      
-      idx = np.where(inRange)
-      y = len(idx[0]) / 50.0
-  
-      mean_firings_y[layer].append(y)
-      mean_firings_x[layer].append(t)  
+  # Excitatory neurons are numbered from 0, after the inhibitory ones.
+  excit_neurons = EXCIT_MODULES * EXCIT_NEURONS_PER_MODULE
+  return select_neurons(net.Firings(), INHIB_NEURONS, INHIB_NEURONS + excit_neurons)
+
+def get_mean_firings(firings):
+  # Mean firings of each module over 50 ms windows centred every 20 ms.
+  bounds = EXCIT_NEURONS_PER_MODULE * np.arange(EXCIT_MODULES + 1)
+  counts = spike_counts(firings, bounds, T)
+
+  mean_firings_x = 20 * np.arange(49)
+  mean_firings_y = window_rates(counts, mean_firings_x - 25, 50)
 
-  return (mean_firings_x, mean_firings_y);
+  return (mean_firings_x, mean_firings_y)
 
 def plot_connectivity_matrix(p, all_connections):
-  output_name = '%sconnectivity_matrix_p=%.1f.eps' % (PLOT_OUTPUT_DIR, p)
+  output_name = connectivity_plot_name(p)
 
   fig = plt.figure()
   ax = fig.add_subplot(111)
@@ -96,10 +99,11 @@ def plot_connectivity_matrix(p, all_connections):
   plt.title('Connections for p = %s' % p)
   plt.xlabel('To')
   plt.ylabel('From')
-  plt.savefig(output_name, format='eps')
+  save_atomic(output_name, plt.savefig, format='eps')
+  plt.close()
 
 def plot_firings(p, all_firings_x, all_firings_y, mean_firings_x, mean_firings_y):
-  output_name = '%sfirings_p=%.1f.eps' % (PLOT_OUTPUT_DIR, p)
+  output_name = firings_plot_name(p)
 
   plt.figure()
   
@@ -118,13 +122,14 @@ def plot_firings(p, all_firings_x, all_firings_y, mean_firings_x, mean_firings_y
   
   # Plot the mean firing rate for each module.
   plt.subplot(212)
-  for layer in mean_firings_x:
-    plt.plot(mean_firings_x[layer], mean_firings_y[layer])
+  for module_firings in mean_firings_y:
+    plt.plot(mean_firings_x, module_firings)
   
   plt.xlabel('Time (ms) + 0s')
   plt.xlim([0, T])
   plt.ylabel('Mean firing rate')
-  plt.savefig(output_name, format='eps')
+  save_atomic(output_name, plt.savefig, format='eps')
+  plt.close()
 
 if __name__ == '__main__':
   main()
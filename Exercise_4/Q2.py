@@ -1,45 +1,61 @@
 from ModNetwork import *
-
-from jpype import *
+from ResultStore import ResultStore
+from Sweep import run_sweep, split_batches, parallel_map, trial_seeds, latest_directory
+from SpikeAnalysis import spike_counts, sliding_window_rates
+from MultiInformation import multi_information
 
 import numpy as np
 import numpy.random as rn
 import matplotlib.pyplot as plt
 
+import functools
 import os
-#import multiprocessing as mp
+import shutil
+import sys
 
 N_TRIALS = 48
 
+# The trials are run in a pool of processes, each simulating a batch of
+# trials together as one ensemble, and their multi-information is then
+# computed in the same number of processes. None uses one process per core.
+PROCESSES = None
+TRIALS_PER_BATCH = 2
+
+# Rewiring probability and seed of each trial, both derived from SWEEP_SEED
+# so that any trial can be rerun on its own.
+SWEEP_SEED = 0
+P_VALUES = rn.RandomState(SWEEP_SEED).rand(N_TRIALS)
+SEEDS = trial_seeds(SWEEP_SEED + 1, N_TRIALS)
+
 IGNORE_MS = 1000 # Ignore the first milliseconds of each simulation.
 SIM_TIME_MS = 60 * 1000
 
+# The time series are the mean firing rates of each module over windows of
+# WINDOW_MS, one every HOP_MS.
+WINDOW_MS = 50
+HOP_MS = 20
+
+# Each batch of trials saves a checkpoint every CHECKPOINT_MS, so that an
+# interrupted sweep continues from there. None saves no checkpoints.
+CHECKPOINT_MS = 5000
+
+# Standard deviation and seed of the noise added to the observations to
+# break ties when estimating the multi-information (see multi_information).
+NOISE = 1e-8
+NOISE_SEED = 0
+
 OUTPUT_DIR = 'results/'
 SERIES_FILE = OUTPUT_DIR + 'series_'
 P_FILE = OUTPUT_DIR + 'p_'
 
 def main():
-  (p_values, all_time_series) = get_data()
+  (p_values, all_time_series) = get_data('--migrate' in sys.argv)
 
-  startJVM(getDefaultJVMPath(), '-Djava.class.path=../infodynamics.jar')
+  # One observation per window, with the rates of the modules as variables.
+  observations = [np.asarray(np.transpose(time_series)) for time_series in all_time_series]
 
-  calcClass = JPackage('infodynamics.measures.continuous.kraskov').MultiInfoCalculatorKraskov2
-  calc = calcClass()
-
-  ys = []
-  for i in range(N_TRIALS):
-    p = p_values[i]
-    time_series = all_time_series[i]
-
-    calc.setProperty('PROP_NORMALISE', 'true')
-    calc.setProperty('K', '4')
-    calc.initialise(8)
-
-    calc.setObservations(np.transpose(time_series))
-
-    result = calc.computeAverageLocalOfObservations() * np.log2(np.e)
-
-    ys.append(result)
+  estimate = functools.partial(multi_information, noise=NOISE, seed=NOISE_SEED)
+  ys = np.array(parallel_map(estimate, observations, PROCESSES)) * np.log2(np.e)
 
   plt.scatter(p_values, ys)
   plt.ylabel('Integration (bits)')
@@ -48,80 +64,97 @@ def main():
   plt.savefig('plots/multiinformation.eps', format='eps')
   plt.show()
 
-  shutdownJVM()
-
-def get_data():
-  if all_result_files_exist():
-    print 'Using saved time series.'
+def get_data(migrate=False):
+  store = ResultStore(OUTPUT_DIR)
 
-    p_files = [P_FILE + str(i) + '.txt' for i in range(N_TRIALS)]
-    series_files = [SERIES_FILE + str(i) + '.txt' for i in range(N_TRIALS)]
+  # Results of earlier runs were saved as text files. Their series cannot be
+  # checked or recomputed without a raster, so they are only copied into the
+  # store when asked for with --migrate; otherwise those trials are rerun.
+  if migrate:
+    store.migrate_text_results(N_TRIALS, P_FILE, SERIES_FILE)
 
-    p_values = [np.loadtxt(f) for f in p_files]
-    all_time_series = [np.loadtxt(f) for f in series_files]
+  missing = [i for i in range(N_TRIALS) if not store.has_trial(i)]
 
+  if len(missing) == 0:
+    print 'Using saved time series.'
   else:
-    print 'Calculating time series.'
+    print 'Calculating time series for %d trials.' % len(missing)
+    report_stale_checkpoints(split_batches(missing, TRIALS_PER_BATCH))
+    run_sweep(run_trials, missing, PROCESSES, TRIALS_PER_BATCH)
 
-    # Get the time series
-    p_values = [rn.rand() for i in range(N_TRIALS)]
-  #  pool = mp.Pool(8)
-    all_time_series = map(get_time_series_from_p, p_values)
+  trials = [store.load_trial(i) for i in range(N_TRIALS)]
 
-    # Ensure that the directory for the results exists.
-    if not os.path.exists(OUTPUT_DIR):
-        os.makedirs(OUTPUT_DIR)
+  p_values = [p for (p, seed, raster, series) in trials]
+  all_time_series = []
 
-    # Save to files
-    for t in range(len(all_time_series)):
-      np.savetxt(SERIES_FILE + str(t) + ".txt", all_time_series[t])
-      np.savetxt(P_FILE + str(t) + ".txt", [p_values[t]])
+  # Series saved with other window settings, or by versions that ignored the
+  # first IGNORE_MS spikes instead of milliseconds, are recomputed from the
+  # raster when there is one.
+  n_windows = len(range(IGNORE_MS, SIM_TIME_MS - WINDOW_MS + 1, HOP_MS))
+  for (p, seed, raster, series) in trials:
+    if len(raster) > 0 and series.shape[1] != n_windows:
+      series = get_time_series(raster)
+    all_time_series.append(series)
 
   return (p_values, all_time_series)
 
-def all_result_files_exist():
-  p_files = [P_FILE + str(i) + '.txt' for i in range(N_TRIALS)]
-  series_files = [SERIES_FILE + str(i) + '.txt' for i in range(N_TRIALS)]
-
-  return all(os.path.isfile(f) for f in p_files + series_files)
-
-def get_time_series_from_p(p):
-  mn = ModNetwork(p)
-  run_net(mn)
-
-  print 'Finished a simulation.'
-  return get_time_series(mn.net)
-
-def run_net(mn):
-  for t in xrange(SIM_TIME_MS):  
+def run_trials(trials):
+  me = ModEnsemble([P_VALUES[i] for i in trials], [SEEDS[i] for i in trials])
+  me.use_poisson_drive(0.01)
+  monitor = me.add_rate_monitor([WINDOW_MS], HOP_MS, IGNORE_MS)
+
+  checkpoint = checkpoint_name(trials)
+  run_net(me, checkpoint)
+
+  print 'Finished the simulations.'
+
+  # Save each trial as soon as it is done, so that an interrupted sweep only
+  # reruns the trials without results.
+  store = ResultStore(OUTPUT_DIR)
+  series = monitor.Series(WINDOW_MS)
+  for (k, (i, mn)) in enumerate(zip(trials, me.members)):
+    time_series = series[k * EXCIT_MODULES:(k + 1) * EXCIT_MODULES]
+    store.save_trial(i, P_VALUES[i], SEEDS[i], mn.net.Firings(), time_series)
+
+  shutil.rmtree(checkpoint, ignore_errors=True)
+
+def checkpoint_name(trials):
+  return OUTPUT_DIR + 'checkpoint_' + '_'.join(str(i) for i in trials)
+
+def report_stale_checkpoints(batches):
+  # A checkpoint is only resumed by a batch of exactly the same trials, so
+  # the checkpoints of other batches, e.g. after changing TRIALS_PER_BATCH,
+  # would be ignored.
+  current = set(os.path.basename(checkpoint_name(trials)) for trials in batches)
+  names = set(name[len('.old-'):] if name.startswith('.old-') else name
+              for name in os.listdir(OUTPUT_DIR))
+
+  for name in sorted(names):
+    if name.startswith('checkpoint_') and name not in current:
+      print 'Ignoring checkpoint %s of another batch of trials; delete it to' % (OUTPUT_DIR + name)
+      print 'start those trials afresh, or rerun with the same TRIALS_PER_BATCH.'
+
+def get_time_series(raster):
+  # The same series as the rate monitor of run_trials gives.
+  bounds = INHIB_NEURONS + EXCIT_NEURONS_PER_MODULE * np.arange(EXCIT_MODULES + 1)
+  counts = spike_counts(raster, bounds, SIM_TIME_MS)
+  return sliding_window_rates(counts, WINDOW_MS, HOP_MS, IGNORE_MS)
+
+def run_net(mn, checkpoint=None):
+  # Continue from the last checkpoint of an interrupted run.
+  start = 0
+  if checkpoint is not None and latest_directory(checkpoint) is not None:
+    start = mn.load_checkpoint(latest_directory(checkpoint))
+    print 'Resuming simulation at time', start
+
+  for t in xrange(start, SIM_TIME_MS):
      mn.update_with_poisson(0.01, t)
 
      if t % 20000 == 0:
        print 'Simulation at time', t
 
-def get_time_series(net):
-  time_series = []
-
-  for layer in range(1, EXCIT_MODULES + 1):
-    firings = net.layer[layer].firings[IGNORE_MS:]
-    firing_times = [f[0] for f in firings]
-
-    firings_per_t = [0] * SIM_TIME_MS
-    for t in firing_times:
-      firings_per_t[t] += 1
-
-    sums = np.cumsum(np.insert(firings_per_t, 0, 0))
-    means = (sums[50:] - sums[:-50]) / 50.0
-
-    time_series.append(means[0::20])
-
-  # Ensure that there is a time series for each module and all time series
-  # have the same length.
-  assert len(time_series) == EXCIT_MODULES, 'incorrect number of time series'
-  assert all(len(time_series[t]) == len(time_series[1]) for t in range(len(time_series))), \
-    'time series have different lengths'
-
-  return time_series
+     if checkpoint is not None and CHECKPOINT_MS is not None and (t + 1) % CHECKPOINT_MS == 0:
+       mn.save_checkpoint(checkpoint)
 
 if __name__ == "__main__":
   main()
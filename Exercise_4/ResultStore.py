@@ -0,0 +1,70 @@
+import numpy as np
+
+import os
+
+from Sweep import save_atomic
+
+# p and seed of a trial. Trials migrated from text files have seed -1.
+TRIAL_DTYPE = np.dtype([('p', 'f8'), ('seed', 'i8')])
+
+
+class ResultStore:
+  """
+  Binary store for the results of a sweep. Trial i is kept in three .npy
+  files in the store's directory:
+
+    trial_i.npy  -- p and seed of the trial (see TRIAL_DTYPE)
+    raster_i.npy -- All spikes as an (n, 2) int32 array of [t, neuron] rows,
+                    neurons numbered with the network's global index
+    series_i.npy -- Time series derived from the raster
+
+  Each file is written atomically and trial_i.npy last, so a trial is in
+  the store once its trial file exists. Trials are loaded as memory maps,
+  which only reads the .npy headers.
+  """
+
+  def __init__(self, directory):
+    self.directory = directory
+
+    if not os.path.exists(directory):
+      os.makedirs(directory)
+
+  def has_trial(self, i):
+    return os.path.isfile(self._file('trial', i))
+
+  def save_trial(self, i, p, seed, raster, series):
+    save_atomic(self._file('raster', i), np.save, np.asarray(raster, dtype=np.int32))
+    save_atomic(self._file('series', i), np.save, np.asarray(series, dtype=float))
+    save_atomic(self._file('trial', i), np.save, np.array((p, seed), dtype=TRIAL_DTYPE))
+
+  def load_trial(self, i):
+    """
+    Return (p, seed, raster, series) of trial i, with raster and series
+    memory-mapped.
+    """
+
+    trial = np.load(self._file('trial', i))
+    raster = np.load(self._file('raster', i), mmap_mode='r')
+    series = np.load(self._file('series', i), mmap_mode='r')
+
+    return (float(trial['p']), int(trial['seed']), raster, series)
+
+  def migrate_text_results(self, n_trials, p_prefix, series_prefix):
+    """
+    Copy the results saved as text files p_i.txt and series_i.txt into the
+    store, once. Text results have no spike raster or seed, so an empty
+    raster and a seed of -1 are stored instead.
+    """
+
+    for i in range(n_trials):
+      p_file = p_prefix + str(i) + '.txt'
+      series_file = series_prefix + str(i) + '.txt'
+
+      if self.has_trial(i) or not (os.path.isfile(p_file) and os.path.isfile(series_file)):
+        continue
+
+      raster = np.zeros([0, 2], dtype=np.int32)
+      self.save_trial(i, float(np.loadtxt(p_file)), -1, raster, np.loadtxt(series_file))
+
+  def _file(self, kind, i):
+    return os.path.join(self.directory, '%s_%d.npy' % (kind, i))
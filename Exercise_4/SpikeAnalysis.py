@@ -0,0 +1,70 @@
+import numpy as np
+
+# Spike trains are (n, 2) arrays of [t, neuron] rows, like IzNetwork.Firings,
+# with t in milliseconds. Groups of neurons, such as the modules of a
+# ModNetwork, are contiguous ranges given by their bounds: group g contains
+# the neurons bounds[g] to bounds[g+1]-1.
+
+def select_neurons(firings, start, stop):
+  """
+  Return the spikes of neurons start to stop-1, numbered from start.
+  """
+  firings = np.asarray(firings).reshape(-1, 2)
+  keep = (firings[:, 1] >= start) & (firings[:, 1] < stop)
+  return firings[keep] - [0, start]
+
+def spike_counts(firings, bounds, t_max, t_min=0):
+  """
+  Return the number of spikes of each group in each millisecond from t_min
+  to t_max-1 as a (groups, t_max - t_min) array. Spikes outside that time
+  or of neurons outside all groups are ignored.
+  """
+
+  firings = np.asarray(firings).reshape(-1, 2)
+  (G, T) = (len(bounds) - 1, t_max - t_min)
+
+  # Each spike is counted in bin group * T + t, and the spikes that are not
+  # counted all go to the extra bin G * T.
+  first = np.full(bounds[-1] + 1, G * T, dtype=np.int64)
+  first[bounds[0]:bounds[-1]] = np.repeat(np.arange(G) * T, np.diff(bounds))
+
+  t = firings[:, 0] - t_min
+  bins = np.where((t >= 0) & (t < T), first[np.minimum(firings[:, 1], bounds[-1])] + t, G * T)
+
+  return np.bincount(np.minimum(bins, G * T), minlength=G * T + 1)[:G * T].reshape(G, T)
+
+def window_rates(counts, starts, window):
+  """
+  Return the mean number of spikes per millisecond of each group over the
+  windows starting at the given milliseconds, as a (groups, windows) array.
+  The parts of a window outside the counts have no spikes.
+
+  Inputs:
+  counts -- Spikes per group and millisecond, see spike_counts
+  starts -- Array with the first millisecond of each window
+  window -- Length of the windows in milliseconds
+  """
+
+  T = counts.shape[1]
+  sums = np.concatenate([np.zeros([len(counts), 1], dtype=counts.dtype), np.cumsum(counts, axis=1)], axis=1)
+
+  lo = np.clip(starts, 0, T)
+  hi = np.clip(np.asarray(starts) + window, 0, T)
+
+  return (sums[:, hi] - sums[:, lo]) / float(window)
+
+def sliding_window_rates(counts, window, hop, start=0):
+  """
+  Return the mean number of spikes per millisecond of each group over the
+  windows that fit in the counts, starting at the given millisecond and
+  every hop milliseconds after it. This is the series a RateMonitor with the
+  same window, hop and start computes during a run.
+  """
+  return window_rates(counts, np.arange(start, counts.shape[1] - window + 1, hop), window)
+
+def population_rates(counts, bounds):
+  """
+  Return the firing rate per neuron in Hz of each group in each millisecond.
+  """
+  return counts * 1000.0 / np.diff(bounds)[:, None]
+
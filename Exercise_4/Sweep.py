@@ -0,0 +1,128 @@
+import multiprocessing as mp
+import numpy.random as rn
+import os
+import shutil
+import signal
+
+
+def run_sweep(run_trials, trials, processes=None, batch_size=1):
+  """
+  Run the trials of a parameter sweep in a pool of processes.
+
+  run_trials is called with a list of at most batch_size trial numbers and
+  has to save the result of each trial itself as soon as it is done (see
+  save_atomic). An interrupted sweep can then be resumed by calling
+  run_sweep again with only the trials whose results are still missing.
+
+  Inputs:
+  run_trials -- Module-level function that runs and saves a list of trials
+  trials     -- List of trial numbers to run
+  processes  -- Number of worker processes. Defaults to the number of cores;
+                1 runs everything in this process.
+  batch_size -- Number of trials handed to run_trials at once
+  """
+
+  # Interrupting the sweep stops the pool, and the trials that finished are
+  # already saved.
+  parallel_map(run_trials, split_batches(trials, batch_size), processes)
+
+def split_batches(trials, batch_size):
+  """
+  Return the batches run_sweep hands the trials to run_trials in.
+  """
+  return [trials[i:i + batch_size] for i in range(0, len(trials), batch_size)]
+
+def parallel_map(function, items, processes=None):
+  """
+  Return map(function, items), computed in a pool of processes.
+
+  Inputs:
+  function  -- Module-level function of one argument
+  items     -- List of arguments
+  processes -- Number of worker processes. Defaults to the number of cores;
+               1 runs everything in this process.
+  """
+
+  if processes == 1:
+    return map(function, items)
+
+  # Workers ignore Ctrl+C so that only the parent handles it and stops the
+  # pool.
+  pool = mp.Pool(processes, signal.signal, (signal.SIGINT, signal.SIG_IGN))
+
+  try:
+    # Waiting with a timeout lets KeyboardInterrupt through in Python 2
+    results = pool.map_async(function, items, chunksize=1).get(2**31)
+  except:
+    pool.terminate()
+    raise
+  else:
+    pool.close()
+  finally:
+    pool.join()
+
+  return results
+
+def trial_seeds(seed, n):
+  """
+  Return n seeds for the trials of a sweep, all derived from one seed so
+  that every trial is reproducible on its own.
+  """
+  return rn.RandomState(seed).randint(2**31, size=n)
+
+def save_atomic(path, save, *args, **kwargs):
+  """
+  Call save(tmp, *args, **kwargs) with a temporary file name tmp in the same
+  directory and with the same extension as path, then rename it to path, so
+  that path either does not exist or is complete.
+  """
+  (directory, name) = os.path.split(path)
+  tmp = os.path.join(directory, '.tmp-' + name)
+
+  save(tmp, *args, **kwargs)
+
+  os.rename(tmp, path)
+
+def save_atomic_directory(path, save, *args, **kwargs):
+  """
+  Call save(tmp, *args, **kwargs) with a temporary directory name tmp in
+  the same directory as path, then replace the directory path with it. The
+  old directory is kept as a backup until the new one is in place, so an
+  interrupted save always leaves a complete directory (see
+  latest_directory).
+  """
+  (directory, name) = os.path.split(path)
+  tmp = os.path.join(directory, '.tmp-' + name)
+  old = os.path.join(directory, '.old-' + name)
+
+  if os.path.isdir(tmp):
+    shutil.rmtree(tmp)
+
+  # A backup is only left by an interrupted save, and still needed if path
+  # is missing.
+  if os.path.isdir(old) and os.path.isdir(path):
+    shutil.rmtree(old)
+
+  save(tmp, *args, **kwargs)
+
+  if os.path.isdir(path):
+    os.rename(path, old)
+  os.rename(tmp, path)
+
+  if os.path.isdir(old):
+    shutil.rmtree(old)
+
+def latest_directory(path):
+  """
+  Return the last complete directory saved to path by save_atomic_directory,
+  or None if there is none.
+  """
+  (directory, name) = os.path.split(path)
+  old = os.path.join(directory, '.old-' + name)
+
+  for candidate in (path, old):
+    if os.path.isdir(candidate):
+      return candidate
+
+  return None
+